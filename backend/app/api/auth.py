@@ -1,41 +1,61 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Response
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from app.models.link import Link
 from app.schemas.user import UserCreate, UserOut, UserLogin
 from app.models.user import User
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.security import (
-    hash_password,
-    verify_password,
+    Principal,
+    hash_password_async,
+    verify_password_async,
     create_session,
     delete_session,
+    get_current_principal,
     get_current_user
 )
+from app.services.account_deletion import (
+    is_account_being_deleted,
+    get_deletion_job,
+    start_account_deletion,
+    run_account_deletion,
+    schedule_account_deletion,
+)
 
 router = APIRouter()
 
 @router.post("/register", response_model=UserOut, status_code=201)
-def register(user_in: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.username == user_in.username).first()
+async def register(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.username == user_in.username))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Имя пользователя уже используется")
     user = User(
         username=user_in.username,
         email=user_in.email,
-        password_hash=hash_password(user_in.password)
+        password_hash=await hash_password_async(user_in.password)
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 @router.post("/login")
-def login(user_in: UserLogin, response: Response, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_in.username).first()
-    if not user or not verify_password(user_in.password, user.password_hash):
+async def login(user_in: UserLogin, response: Response, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.username == user_in.username))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Неверные учетные данные")
+    verified, new_hash = await verify_password_async(user_in.password, user.password_hash)
+    if not verified:
         raise HTTPException(status_code=401, detail="Неверные учетные данные")
-    session_token = create_session(user.id)
+    if await is_account_being_deleted(user.id):
+        raise HTTPException(status_code=409, detail="Аккаунт удаляется")
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
+    session_token = await run_in_threadpool(create_session, user)
     response.set_cookie(key="session_id", value=session_token, httponly=True, max_age=86400, path="/")
     return {"message": "Успешный вход", "user": {"id": user.id, "username": user.username}}
 
@@ -52,8 +72,20 @@ def profile(current_user: User = Depends(get_current_user)):
     return current_user
 
 @router.delete("/user", response_model=dict)
-def delete_user(request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    db.query(Link).filter(Link.created_by_id == current_user.id).delete()
-    db.delete(current_user)
-    db.commit()
-    return {"message": "Пользователь удалён"}
\ No newline at end of file
+async def delete_user(response: Response, principal: Principal = Depends(get_current_principal)):
+    job_id = await start_account_deletion(principal.id)
+    response.delete_cookie("session_id", path="/")
+    # Небольшой аккаунт удаляется сразу, большой — фоновой задачей пачками
+    if await run_account_deletion(job_id, principal.id, max_batches=1):
+        return {"message": "Пользователь удалён", "job_id": job_id}
+    schedule_account_deletion(job_id, principal.id)
+    response.status_code = 202
+    return {"message": "Удаление пользователя запущено", "job_id": job_id}
+
+@router.get("/user/deletion/{job_id}", response_model=dict)
+async def get_user_deletion(job_id: str):
+    # job_id случайный и известен только удаляемому пользователю; его сессии уже отозваны
+    job = await get_deletion_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
\ No newline at end of file
@@ -1,105 +1,375 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends, Query
+import io
+import tempfile
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timedelta, timezone
 
-from app.schemas.link import LinkCreate, LinkOut, LinkUpdate, LinkStats, LinkSearchOut
+from app.schemas.link import (
+    LinkCreate,
+    LinkOut,
+    LinkUpdate,
+    LinkStats,
+    LinkSearchOut,
+    LinkBatchCreate,
+    LinkBatchOut,
+    LinkBatchItemResult,
+    LinkSummary,
+    LinkImportOut,
+    check_redirect_policy,
+)
 from app.models.link import Link
-from app.core.database import get_db
-from app.core.security import get_current_user
-from app.services.shortener import generate_short_code
-from app.core.cache import delete_url_cache
+from app.core.database import get_db, get_read_db
+from app.core.security import get_current_principal
+from app.services.allocator import get_allocator
+from app.core.config import (
+    SHORT_CODE_MAX_ATTEMPTS,
+    LINK_BATCH_CHUNK_SIZE,
+    LINKS_PAGE_SIZE,
+    LINKS_PAGE_MAX_SIZE,
+    LINKS_STREAM_BATCH_SIZE,
+    STATS_DEFAULT_RANGE_DAYS,
+    LINKS_SUMMARY_TOP_N,
+    LINKS_SUMMARY_MAX_TOP_N,
+)
+from app.core.cache import (
+    CachedLink,
+    delete_url_cache,
+    set_urls_to_cache,
+    get_search_from_cache,
+    set_search_to_cache,
+    delete_search_cache,
+    _as_utc,
+)
+from app.services.url_index import hash_url
+from app.services.analytics import get_click_series, count_unique_visitors
+from app.api.serializers import (
+    LINK_OUT_COLUMNS,
+    link_to_dict,
+    links_to_dicts,
+    stats_to_dict,
+    iter_links_ndjson,
+    iter_links_csv,
+    etag_json_response,
+)
+from app.services.link_transfer import import_links
 
 router = APIRouter()
 
+_SHORT_CODE_INDEX = "ix_link_short_code"
+
+def _resolve_expires_at(link_in: LinkCreate):
+    expires_at = None
+    if link_in.expires_in_days and link_in.expires_in_days > 0:
+        expires_at = datetime.utcnow() + timedelta(days=link_in.expires_in_days)
+    if link_in.expires_at:
+        expires_at = link_in.expires_at
+    return expires_at
+
 @router.post("/", response_model=LinkOut, status_code=201)
-def create_link(link_in: LinkCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def create_link(link_in: LinkCreate, db: Session = Depends(get_db), current_user=Depends(get_current_principal)):
     if link_in.custom_alias:
         existing = db.query(Link).filter(Link.short_code == link_in.custom_alias).first()
         if existing:
             raise HTTPException(status_code=400, detail="Такой alias уже используется")
-        short_code = link_in.custom_alias
+    expires_at = _resolve_expires_at(link_in)
+    # Код выдает аллокатор без SELECT; коллизию ловит уникальный индекс
+    for _ in range(SHORT_CODE_MAX_ATTEMPTS):
+        new_link = Link(
+            original_url=link_in.original_url,
+            short_code=link_in.custom_alias or get_allocator().allocate(db),
+            expires_at=expires_at,
+            redirect_code=link_in.redirect_code,
+            exact_clicks=link_in.exact_clicks,
+            created_by_id=current_user.id
+        )
+        db.add(new_link)
+        try:
+            db.commit()
+            break
+        except IntegrityError as exc:
+            db.rollback()
+            # Повторяем только коллизию кода, прочие нарушения целостности пробрасываем
+            if exc.orig.diag.constraint_name != _SHORT_CODE_INDEX:
+                raise
+            if link_in.custom_alias:
+                raise HTTPException(status_code=400, detail="Такой alias уже используется")
     else:
-        short_code = generate_short_code()
-        while db.query(Link).filter(Link.short_code == short_code).first():
-            short_code = generate_short_code()
-    expires_at = None
-    if link_in.expires_in_days and link_in.expires_in_days > 0:
-        expires_at = datetime.utcnow() + timedelta(days=link_in.expires_in_days)
-    if link_in.expires_at:
-        expires_at = link_in.expires_at
-    new_link = Link(
-        original_url=link_in.original_url,
-        short_code=short_code,
-        expires_at=expires_at,
-        created_by_id=current_user.id
-    )
-    db.add(new_link)
-    db.commit()
+        raise HTTPException(status_code=503, detail="Не удалось выделить короткий код, повторите попытку")
     db.refresh(new_link)
     return new_link
 
+def _allocate_unique_codes(db: Session, count: int, reserved: set) -> List[str]:
+    # Коды строк одного INSERT должны различаться: ON CONFLICT DO NOTHING вставит одну из
+    # строк с одинаковым кодом, а RETURNING короткого кода не различит, чья она
+    codes = []
+    while len(codes) < count:
+        for code in get_allocator().allocate_many(db, count - len(codes)):
+            if code not in reserved:
+                reserved.add(code)
+                codes.append(code)
+    return codes
+
+@router.post("/batch", response_model=LinkBatchOut, status_code=201)
+def create_links_batch(batch: LinkBatchCreate, db: Session = Depends(get_db), current_user=Depends(get_current_principal)):
+    items = batch.items
+    results = [LinkBatchItemResult(index=index) for index in range(len(items))]
+    aliases = [item.custom_alias for item in items if item.custom_alias]
+    taken = set()
+    if aliases:
+        taken = set(db.execute(select(Link.short_code).where(Link.short_code.in_(aliases))).scalars())
+    reserved = set(aliases)
+    codes = iter(_allocate_unique_codes(db, len(items) - len(aliases), reserved))
+    pending = []
+    for index, item in enumerate(items):
+        if item.custom_alias:
+            if item.custom_alias in taken:
+                results[index].error = "Такой alias уже используется"
+                continue
+            taken.add(item.custom_alias)
+        pending.append((index, {
+            "original_url": str(item.original_url),
+            "url_hash": hash_url(item.original_url),
+            "short_code": item.custom_alias or next(codes),
+            "expires_at": _resolve_expires_at(item),
+            "redirect_code": item.redirect_code,
+            "exact_clicks": item.exact_clicks,
+            "created_by_id": current_user.id,
+            "access_count": 0,
+        }))
+    created = []
+    for _ in range(SHORT_CODE_MAX_ATTEMPTS):
+        retry = []
+        for start in range(0, len(pending), LINK_BATCH_CHUNK_SIZE):
+            chunk = pending[start:start + LINK_BATCH_CHUNK_SIZE]
+            stmt = (
+                insert(Link)
+                .values([row for _, row in chunk])
+                .on_conflict_do_nothing(index_elements=[Link.short_code])
+                .returning(Link.short_code)
+            )
+            inserted = set(db.execute(stmt).scalars())
+            for index, row in chunk:
+                if row["short_code"] in inserted:
+                    results[index].short_code = row["short_code"]
+                    created.append(row)
+                elif items[index].custom_alias:
+                    results[index].error = "Такой alias уже используется"
+                else:
+                    retry.append((index, row))
+        if not retry:
+            break
+        # Коллизия сгенерированного кода: выдаем новые коды только этим элементам
+        for (index, row), code in zip(retry, _allocate_unique_codes(db, len(retry), reserved)):
+            row["short_code"] = code
+        pending = retry
+    else:
+        for index, _ in retry:
+            results[index].error = "Не удалось выделить короткий код, повторите попытку"
+    db.commit()
+    if batch.warm_cache and created:
+        set_urls_to_cache(
+            (row["short_code"], CachedLink(
+                row["original_url"], row["expires_at"], redirect_code=row["redirect_code"], exact_clicks=row["exact_clicks"]
+            )) for row in created
+        )
+    return {"created": len(created), "results": results}
+
 @router.get("/", response_model=List[LinkOut])
-def list_links(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    links = db.query(Link).filter(Link.created_by_id == current_user.id).all()
-    return links
+def list_links(
+    request: Request,
+    cursor: Optional[int] = Query(None, description="id последней ссылки предыдущей страницы (заголовок X-Next-Cursor)"),
+    limit: int = Query(LINKS_PAGE_SIZE, ge=1, le=LINKS_PAGE_MAX_SIZE),
+    response_format: str = Query("json", alias="format", regex="^(json|ndjson)$"),
+    current_user=Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
+):
+    # Кортежи колонок вместо ORM-объектов; ответ собирается без повторной валидации LinkOut
+    query = select(*LINK_OUT_COLUMNS).where(Link.created_by_id == current_user.id).order_by(Link.id)
+    if cursor is not None:
+        query = query.where(Link.id > cursor)
+    if response_format == "ndjson":
+        # Все ссылки после cursor, построчно и с постоянным расходом памяти
+        rows = db.execute(query.execution_options(stream_results=True)).yield_per(LINKS_STREAM_BATCH_SIZE)
+        return StreamingResponse(iter_links_ndjson(rows), media_type="application/x-ndjson")
+    links = db.execute(query.limit(limit + 1)).all()
+    headers = {}
+    if len(links) > limit:
+        links = links[:limit]
+        headers["X-Next-Cursor"] = str(links[-1].id)
+    return etag_json_response(request, links_to_dicts(links), headers)
+
+@router.get("/export")
+def export_links(
+    export_format: str = Query("csv", alias="format", regex="^(csv|ndjson)$"),
+    current_user=Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
+):
+    # Серверный курсор: память не зависит от числа ссылок
+    query = select(*LINK_OUT_COLUMNS).where(Link.created_by_id == current_user.id).order_by(Link.id)
+    rows = db.execute(query.execution_options(stream_results=True)).yield_per(LINKS_STREAM_BATCH_SIZE)
+    if export_format == "ndjson":
+        body, media_type = iter_links_ndjson(rows), "application/x-ndjson"
+    else:
+        body, media_type = iter_links_csv(rows), "text/csv; charset=utf-8"
+    headers = {"Content-Disposition": f'attachment; filename="links.{export_format}"'}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+@router.post("/import", response_model=LinkImportOut)
+async def import_links_file(
+    request: Request,
+    import_format: str = Query("csv", alias="format", regex="^(csv|ndjson)$"),
+    current_user=Depends(get_current_principal),
+):
+    # Тело запроса - сам файл (curl --data-binary @links.csv), копится во временном файле на диске.
+    # SpooledTemporaryFile не годится: до Python 3.11 его нельзя обернуть в TextIOWrapper
+    with tempfile.TemporaryFile() as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        source = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        try:
+            return await run_in_threadpool(import_links, source, current_user.id, import_format)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Файл должен быть в кодировке UTF-8")
+        finally:
+            source.detach()
+
+@router.get("/summary", response_model=LinkSummary)
+def get_links_summary(
+    top: int = Query(LINKS_SUMMARY_TOP_N, ge=1, le=LINKS_SUMMARY_MAX_TOP_N),
+    current_user=Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
+):
+    # Агрегаты считает БД: клиенту не нужно выкачивать весь список ссылок
+    now = datetime.now(timezone.utc)
+    own = Link.created_by_id == current_user.id
+    total_links, total_clicks, expired_links = db.query(
+        func.count(Link.id),
+        func.coalesce(func.sum(Link.access_count), 0),
+        func.count(Link.id).filter(Link.expires_at <= now),
+    ).filter(own).one()
+    top_links = (
+        db.query(Link.short_code, Link.original_url, Link.access_count, Link.last_accessed)
+        .filter(own)
+        .order_by(Link.access_count.desc().nullslast(), Link.id)
+        .limit(top)
+        .all()
+    )
+    return {
+        "total_links": total_links,
+        "total_clicks": total_clicks,
+        "active_links": total_links - expired_links,
+        "expired_links": expired_links,
+        "top": [link._asdict() for link in top_links],
+    }
 
 @router.get("/search", response_model=LinkSearchOut)
 def search_link(original_url: str = Query(..., alias="original_url"), db: Session = Depends(get_db)):
-    link = db.query(Link).filter(Link.original_url == original_url).first()
+    # Результат ложится в кэш search:*, поэтому читается с основной БД, а не с отстающей реплики
+    url_hash = hash_url(original_url)
+    cached = get_search_from_cache(url_hash)
+    if cached:
+        return cached
+    link = db.query(Link.short_code, Link.original_url).filter(Link.url_hash == url_hash).first()
     if not link:
         raise HTTPException(status_code=404, detail="Ссылка не найдена")
-    return {"short_code": link.short_code, "original_url": link.original_url}
+    result = {"short_code": link.short_code, "original_url": link.original_url}
+    set_search_to_cache(url_hash, result)
+    return result
 
 @router.get("/{short_code}", response_model=LinkOut)
-def get_link(short_code: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    link = db.query(Link).filter(Link.short_code == short_code).first()
+def get_link(short_code: str, request: Request, current_user=Depends(get_current_principal), db: Session = Depends(get_read_db)):
+    link = db.execute(select(*LINK_OUT_COLUMNS, Link.created_by_id).where(Link.short_code == short_code)).first()
     if not link:
         raise HTTPException(status_code=404, detail="Ссылка не найдена")
     if link.created_by_id != current_user.id:
         raise HTTPException(status_code=403, detail="Доступ запрещен")
-    return link
+    return etag_json_response(request, link_to_dict(link))
 
 @router.put("/{short_code}", response_model=LinkOut)
-def update_link(short_code: str, link_update: LinkUpdate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def update_link(short_code: str, link_update: LinkUpdate, db: Session = Depends(get_db), current_user=Depends(get_current_principal)):
     link = db.query(Link).filter(Link.short_code == short_code).first()
     if not link:
         raise HTTPException(status_code=404, detail="Ссылка не найдена")
     if link.created_by_id != current_user.id:
         raise HTTPException(status_code=403, detail="Доступ запрещен")
+    old_url_hash = link.url_hash
     if link_update.original_url:
         link.original_url = link_update.original_url
     if link_update.expires_in_days is not None:
         link.expires_at = datetime.utcnow() + timedelta(days=link_update.expires_in_days)
     if link_update.expires_at is not None:
         link.expires_at = link_update.expires_at
+    if link_update.redirect_code is not None:
+        link.redirect_code = link_update.redirect_code
+    if link_update.exact_clicks is not None:
+        link.exact_clicks = link_update.exact_clicks
+    try:
+        check_redirect_policy(link.redirect_code, link.exact_clicks)
+    except ValueError as exc:
+        db.rollback()
+        raise HTTPException(status_code=422, detail=str(exc))
     db.commit()
     db.refresh(link)
     delete_url_cache(short_code)
+    if old_url_hash:
+        delete_search_cache(old_url_hash)
     return link
 
 @router.delete("/{short_code}", status_code=204)
-def delete_link(short_code: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def delete_link(short_code: str, db: Session = Depends(get_db), current_user=Depends(get_current_principal)):
     link = db.query(Link).filter(Link.short_code == short_code).first()
     if not link:
         raise HTTPException(status_code=404, detail="Ссылка не найдена")
     if link.created_by_id != current_user.id:
         raise HTTPException(status_code=403, detail="Доступ запрещен")
+    url_hash = link.url_hash
     db.delete(link)
     db.commit()
     delete_url_cache(short_code)
+    if url_hash:
+        delete_search_cache(url_hash)
     return
 
 @router.get("/{short_code}/stats", response_model=LinkStats)
-def get_link_stats(short_code: str, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    link = db.query(Link).filter(Link.short_code == short_code).first()
+def get_link_stats(
+    short_code: str,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = Query(None),
+    granularity: Optional[str] = Query(None, regex="^(hour|day)$"),
+    current_user=Depends(get_current_principal),
+    db: Session = Depends(get_read_db),
+):
+    link = db.execute(
+        select(
+            Link.id,
+            Link.short_code,
+            Link.original_url,
+            Link.created_at,
+            Link.access_count,
+            Link.last_accessed,
+            Link.created_by_id,
+        ).where(Link.short_code == short_code)
+    ).first()
     if not link:
         raise HTTPException(status_code=404, detail="Ссылка не найдена")
     if link.created_by_id != current_user.id:
         raise HTTPException(status_code=403, detail="Доступ запрещен")
-    return {
+    stats = {
         "original_url": link.original_url,
         "created_at": link.created_at,
         "access_count": link.access_count,
         "last_accessed": link.last_accessed,
-    }
\ No newline at end of file
+    }
+    end = _as_utc(to) if to else datetime.now(timezone.utc)
+    start = _as_utc(from_) if from_ else end - timedelta(days=STATS_DEFAULT_RANGE_DAYS)
+    stats["unique_visitors"] = count_unique_visitors(link.short_code, start, end)
+    if from_ or to or granularity:
+        stats["series"] = get_click_series(db, link.id, start, end, granularity or "hour")
+    return ORJSONResponse(stats_to_dict(stats))
\ No newline at end of file
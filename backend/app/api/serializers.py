@@ -0,0 +1,65 @@
+"""Быстрая сериализация ссылок без ORM-объектов и повторной валидации Pydantic.
+
+Колонки и ключи берутся из полей схем один раз при импорте, поэтому JSON
+совпадает с ответом через response_model. URL из БД уже прошли валидацию
+AnyHttpUrl при записи и отдаются как есть.
+"""
+import csv
+import hashlib
+import io
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+import orjson
+from fastapi import Request, Response
+
+from app.models.link import Link
+from app.schemas.link import LinkOut, LinkStats
+
+# Порядок ключей как в LinkOut: сначала поля LinkBase, затем собственные
+LINK_OUT_FIELDS = tuple(LinkOut.__fields__)
+LINK_OUT_COLUMNS = tuple(getattr(Link, name) for name in LINK_OUT_FIELDS)
+LINK_STATS_FIELDS = tuple(LinkStats.__fields__)
+
+def link_to_dict(row) -> dict:
+    # Лишние колонки в конце строки (например, created_by_id) отбрасываются zip
+    return dict(zip(LINK_OUT_FIELDS, row))
+
+def links_to_dicts(rows: Iterable) -> list:
+    return [dict(zip(LINK_OUT_FIELDS, row)) for row in rows]
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+def etag_json_response(request: Request, content, headers: Optional[dict] = None) -> Response:
+    # ETag от тела ответа: повторный запрос без изменений получает 304 без тела
+    body = orjson.dumps(content)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def stats_to_dict(stats: dict) -> dict:
+    return {name: stats.get(name) for name in LINK_STATS_FIELDS}
+
+def iter_links_ndjson(rows: Iterable) -> Iterator[bytes]:
+    dumps = orjson.dumps
+    for row in rows:
+        yield dumps(dict(zip(LINK_OUT_FIELDS, row))) + b"\n"
+
+def iter_links_csv(rows: Iterable, chunk_size: int = 1 << 16) -> Iterator[str]:
+    # Даты в ISO 8601, как в JSON; пустое поле - NULL
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(LINK_OUT_FIELDS)
+    for row in rows:
+        writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -1,17 +1,470 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
 import redis
-from app.core.config import REDIS_URL
+from redis import asyncio as aioredis
+from app.core.config import (
+    REDIS_URL,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT,
+    L1_CACHE_SIZE,
+    L1_CACHE_TTL,
+    CACHE_INVALIDATION_CHANNEL,
+    LINK_CACHE_TTL,
+    SEARCH_CACHE_TTL,
+    CACHE_XFETCH_BETA,
+    CACHE_LAYOUT,
+    CACHE_HASH_BUCKET_BITS,
+    CACHE_EXPECTED_LINKS,
+    CACHE_SWEEP_INTERVAL,
+    CACHE_SWEEP_BATCH,
+)
+
+logger = logging.getLogger(__name__)
 
 redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
 
-def get_url_from_cache(short_code: str) -> str:
+# Общий пул соединений для асинхронного клиента: при исчерпании пула ждем, а не падаем
+async_redis_pool = aioredis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    decode_responses=True,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+)
+async_redis_client = aioredis.Redis(connection_pool=async_redis_pool)
+
+
+class LocalCache:
+    """Ограниченный LRU-кэш с TTL внутри процесса (L1 перед Redis)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        # Кэш читают и event loop, и потоки threadpool синхронных эндпоинтов
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+local_cache = LocalCache(L1_CACHE_SIZE, L1_CACHE_TTL)
+# Счетчики обращений к Redis для /metrics
+cache_stats = {"redis_hits": 0, "redis_misses": 0}
+# Все L1-кэши процесса, из которых подписчик удаляет инвалидированные ключи
+_local_caches = [local_cache]
+_invalidation_task: Optional[asyncio.Task] = None
+_sweep_task: Optional[asyncio.Task] = None
+
+# Версия формата записи: записи другого формата считаются промахом
+CACHE_ENTRY_VERSION = 1
+
+
+class CachedLink(NamedTuple):
+    url: str
+    expires_at: Optional[datetime] = None
+    # Момент истечения записи в кэше (epoch) и время ее загрузки из БД, с
+    refresh_at: Optional[float] = None
+    delta: float = 0.0
+    redirect_code: int = 302
+    exact_clicks: bool = False
+
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= datetime.now(timezone.utc)
+
+    def max_age(self, limit: int) -> int:
+        # Браузер/CDN не должны держать редирект дольше срока жизни ссылки
+        if self.expires_at is None:
+            return limit
+        remaining = (_as_utc(self.expires_at) - datetime.now(timezone.utc)).total_seconds()
+        return max(0, min(limit, int(remaining)))
+
+    def should_refresh(self, beta: float = CACHE_XFETCH_BETA) -> bool:
+        # XFetch: чем ближе истечение и дольше загрузка, тем вероятнее досрочное обновление
+        if self.refresh_at is None or not self.delta:
+            return False
+        return time.time() - self.delta * beta * math.log(1.0 - random.random()) >= self.refresh_at
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Наивные даты в проекте пишутся в UTC (datetime.utcnow)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def _encode_entry(entry: CachedLink) -> str:
+    expires = _as_utc(entry.expires_at).timestamp() if entry.expires_at else None
+    data = {"v": CACHE_ENTRY_VERSION, "u": entry.url, "e": expires}
+    # x и d необязательны: записи без них просто не обновляются досрочно
+    if entry.refresh_at is not None:
+        data["x"] = round(entry.refresh_at, 3)
+        data["d"] = round(entry.delta, 4)
+    # Политика по умолчанию (302, без точного подсчета) не пишется, как и в записях старого формата
+    if entry.redirect_code != 302:
+        data["r"] = entry.redirect_code
+    if entry.exact_clicks:
+        data["c"] = 1
+    return json.dumps(data, separators=(",", ":"))
+
+def _decode_entry(raw: str) -> Optional[CachedLink]:
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or data.get("v") != CACHE_ENTRY_VERSION:
+        return None
+    expires = data.get("e")
+    return CachedLink(
+        data["u"],
+        datetime.fromtimestamp(expires, timezone.utc) if expires is not None else None,
+        data.get("x"),
+        data.get("d", 0.0),
+        data.get("r", 302),
+        bool(data.get("c")),
+    )
+
+def _entry_ttl(entry: CachedLink, ttl: int) -> int:
+    # Живая ссылка хранится не дольше оставшегося срока жизни,
+    # истекшая - на полный ttl, чтобы отвечать 410 без запроса к БД
+    if entry.expires_at is None:
+        return ttl
+    remaining = int((_as_utc(entry.expires_at) - datetime.now(timezone.utc)).total_seconds())
+    if remaining <= 0:
+        return ttl
+    return max(1, min(ttl, remaining))
+
+def _stamp(entry: CachedLink, ttl: int) -> CachedLink:
+    return entry._replace(refresh_at=time.time() + ttl)
+
+def link_bucket_key(short_code: str, bits: int = CACHE_HASH_BUCKET_BITS) -> str:
+    # Старшие биты хэша кода: коды равномерно расходятся по 2**bits бакетам
+    prefix = int.from_bytes(hashlib.blake2b(short_code.encode(), digest_size=4).digest(), "big") >> (32 - bits)
+    return f"lh:{prefix:0{(bits + 3) // 4}x}"
+
+def _encode_hash_value(entry: CachedLink) -> str:
+    # У полей хэша нет своего TTL: срок записи хранится перед ней, его читает очистка без разбора JSON
+    return f"{int(entry.refresh_at)}|{_encode_entry(entry)}"
+
+def _hash_value_deadline(value: str) -> int:
+    deadline = value.partition("|")[0]
+    return int(deadline) if deadline.isdigit() else 0
+
+def _decode_cached(raw: Optional[str]) -> Optional[CachedLink]:
+    if not raw:
+        return None
+    if CACHE_LAYOUT != "hash":
+        return _decode_entry(raw)
+    if _hash_value_deadline(raw) <= time.time():
+        return None
+    return _decode_entry(raw.partition("|")[2])
+
+def _read_cached(client, short_code: str):
+    # Для асинхронного клиента возвращает корутину
+    if CACHE_LAYOUT == "hash":
+        return client.hget(link_bucket_key(short_code), short_code)
+    return client.get(f"link:{short_code}")
+
+def _queue_set(pipe, short_code: str, entry: CachedLink, entry_ttl: int):
+    if CACHE_LAYOUT == "hash":
+        bucket = link_bucket_key(short_code)
+        pipe.hset(bucket, short_code, _encode_hash_value(entry))
+        # TTL бакета - страховка для заброшенных бакетов, поля удаляет очистка
+        pipe.expire(bucket, max(entry_ttl, LINK_CACHE_TTL))
+    else:
+        pipe.setex(f"link:{short_code}", entry_ttl, _encode_entry(entry))
+
+def _queue_delete(pipe, short_codes):
+    if CACHE_LAYOUT == "hash":
+        buckets = {}
+        for short_code in short_codes:
+            buckets.setdefault(link_bucket_key(short_code), []).append(short_code)
+        for bucket, fields in buckets.items():
+            pipe.hdel(bucket, *fields)
+    elif short_codes:
+        pipe.unlink(*[f"link:{short_code}" for short_code in short_codes])
+
+def get_url_from_cache(short_code: str) -> Optional[CachedLink]:
     key = f"link:{short_code}"
-    value = redis_client.get(key)
-    return value if value else None
+    entry = local_cache.get(key)
+    if entry:
+        return entry
+    entry = _decode_cached(_read_cached(redis_client, short_code))
+    cache_stats["redis_hits" if entry else "redis_misses"] += 1
+    if entry:
+        local_cache.set(key, entry, _entry_ttl(entry, LINK_CACHE_TTL))
+    return entry
 
-def set_url_to_cache(short_code: str, url: str, ttl: int = 3600):
+def set_url_to_cache(
+    short_code: str,
+    url: str,
+    expires_at: Optional[datetime] = None,
+    ttl: int = LINK_CACHE_TTL,
+    redirect_code: int = 302,
+    exact_clicks: bool = False,
+):
     key = f"link:{short_code}"
-    redis_client.setex(key, ttl, url)
+    entry = CachedLink(url, expires_at, redirect_code=redirect_code, exact_clicks=exact_clicks)
+    entry_ttl = _entry_ttl(entry, ttl)
+    entry = _stamp(entry, entry_ttl)
+    pipe = redis_client.pipeline(transaction=False)
+    _queue_set(pipe, short_code, entry, entry_ttl)
+    pipe.execute()
+    local_cache.set(key, entry, entry_ttl)
+
+def set_urls_to_cache(entries, ttl: int = LINK_CACHE_TTL):
+    # entries: пары (short_code, CachedLink); один round-trip на всю пачку
+    pipe = redis_client.pipeline(transaction=False)
+    for short_code, entry in entries:
+        entry_ttl = _entry_ttl(entry, ttl)
+        _queue_set(pipe, short_code, _stamp(entry, entry_ttl), entry_ttl)
+    pipe.execute()
+
+def register_local_cache(cache: LocalCache):
+    _local_caches.append(cache)
+
+def publish_invalidation(key: str):
+    # Остальные воркеры удалят ключ из своего L1 по сообщению
+    redis_client.publish(CACHE_INVALIDATION_CHANNEL, key)
 
 def delete_url_cache(short_code: str):
     key = f"link:{short_code}"
-    redis_client.delete(key)
\ No newline at end of file
+    if CACHE_LAYOUT == "hash":
+        redis_client.hdel(link_bucket_key(short_code), short_code)
+    else:
+        redis_client.delete(key)
+    local_cache.delete(key)
+    publish_invalidation(key)
+
+def get_search_from_cache(url_hash: str) -> Optional[dict]:
+    value = redis_client.get(f"search:{url_hash}")
+    return json.loads(value) if value else None
+
+def set_search_to_cache(url_hash: str, result: dict, ttl: int = SEARCH_CACHE_TTL):
+    redis_client.setex(f"search:{url_hash}", ttl, json.dumps(result))
+
+def delete_search_cache(url_hash: str):
+    redis_client.delete(f"search:{url_hash}")
+
+async def get_url_from_cache_async(short_code: str) -> Optional[CachedLink]:
+    key = f"link:{short_code}"
+    entry = local_cache.get(key)
+    if entry:
+        return entry
+    entry = _decode_cached(await _read_cached(async_redis_client, short_code))
+    cache_stats["redis_hits" if entry else "redis_misses"] += 1
+    if entry:
+        local_cache.set(key, entry, _entry_ttl(entry, LINK_CACHE_TTL))
+    return entry
+
+async def set_url_to_cache_async(
+    short_code: str,
+    url: str,
+    expires_at: Optional[datetime] = None,
+    ttl: int = LINK_CACHE_TTL,
+    delta: float = 0.0,
+    redirect_code: int = 302,
+    exact_clicks: bool = False,
+) -> CachedLink:
+    key = f"link:{short_code}"
+    entry = CachedLink(url, expires_at, delta=delta, redirect_code=redirect_code, exact_clicks=exact_clicks)
+    entry_ttl = _entry_ttl(entry, ttl)
+    entry = _stamp(entry, entry_ttl)
+    pipe = async_redis_client.pipeline(transaction=False)
+    _queue_set(pipe, short_code, entry, entry_ttl)
+    await pipe.execute()
+    local_cache.set(key, entry, entry_ttl)
+    return entry
+
+async def set_urls_to_cache_async(entries, ttl: int = LINK_CACHE_TTL):
+    pipe = async_redis_client.pipeline(transaction=False)
+    for short_code, entry in entries:
+        entry_ttl = _entry_ttl(entry, ttl)
+        _queue_set(pipe, short_code, _stamp(entry, entry_ttl), entry_ttl)
+    await pipe.execute()
+
+async def delete_url_caches_async(short_codes, url_hashes=()):
+    # Пачка ключей удаляется одним pipeline; UNLINK освобождает память в фоне
+    short_codes = list(short_codes)
+    search_keys = [f"search:{url_hash}" for url_hash in url_hashes if url_hash]
+    keys = [f"link:{short_code}" for short_code in short_codes] + search_keys
+    if not keys:
+        return
+    pipe = async_redis_client.pipeline(transaction=False)
+    _queue_delete(pipe, short_codes)
+    if search_keys:
+        pipe.unlink(*search_keys)
+    for key in keys:
+        for cache in _local_caches:
+            cache.delete(key)
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, key)
+    await pipe.execute()
+
+async def _listen_invalidations():
+    while True:
+        pubsub = async_redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            # Пока подписки не было, сообщения могли потеряться
+            for cache in _local_caches:
+                cache.clear()
+            async for message in pubsub.listen():
+                for cache in _local_caches:
+                    cache.delete(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Потеряна подписка на инвалидацию кэша, переподключаемся", exc_info=True)
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.reset()
+
+def start_cache_invalidation_listener():
+    global _invalidation_task
+    _invalidation_task = asyncio.create_task(_listen_invalidations())
+
+async def stop_cache_invalidation_listener():
+    global _invalidation_task
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        try:
+            await _invalidation_task
+        except asyncio.CancelledError:
+            pass
+    _invalidation_task = None
+
+# Проверка и удаление внутри Redis: бакеты не гоняются по сети, и свежая запись
+# не может быть удалена между чтением и HDEL
+_SWEEP_SCRIPT = """
+local now = tonumber(ARGV[1])
+local removed = 0
+for _, bucket in ipairs(KEYS) do
+    local fields = redis.call('HGETALL', bucket)
+    for i = 1, #fields, 2 do
+        local deadline = tonumber(string.match(fields[i + 1], '^(%d+)|')) or 0
+        if deadline <= now then
+            redis.call('HDEL', bucket, fields[i])
+            removed = removed + 1
+        end
+    end
+end
+return removed
+"""
+_sweep_script = async_redis_client.register_script(_SWEEP_SCRIPT)
+
+async def sweep_hash_cache(batch: int = CACHE_SWEEP_BATCH) -> int:
+    """Удаляет из бакетов lh:* поля с истекшим сроком; возвращает число удаленных."""
+    removed = 0
+    cursor = 0
+    while True:
+        cursor, buckets = await async_redis_client.scan(cursor, match="lh:*", count=batch, _type="hash")
+        if buckets:
+            removed += await _sweep_script(keys=buckets, args=[int(time.time())])
+        if cursor == 0:
+            return removed
+        await asyncio.sleep(0)
+
+def _listpack_limit(limits: dict, name: str) -> int:
+    # Redis 7 называет лимиты listpack, Redis 6 - ziplist
+    return int(limits.get(f"hash-max-listpack-{name}") or limits.get(f"hash-max-ziplist-{name}") or 0)
+
+async def _check_listpack_limits():
+    # Бакет, в котором больше полей или поле длиннее лимита, становится hashtable, и экономия пропадает
+    try:
+        limits = await async_redis_client.config_get("hash-max-*")
+    except Exception:
+        return
+    if _listpack_limit(limits, "value") < 256:
+        logger.warning(
+            "CACHE_LAYOUT=hash: hash-max-listpack-value=%d, записи ссылок не поместятся в listpack",
+            _listpack_limit(limits, "value"),
+        )
+    # Запас в полтора раза на неравномерное распределение кодов по бакетам
+    expected_fields = 1.5 * CACHE_EXPECTED_LINKS / 2 ** CACHE_HASH_BUCKET_BITS
+    if _listpack_limit(limits, "entries") < expected_fields:
+        logger.warning(
+            "CACHE_LAYOUT=hash: hash-max-listpack-entries=%d, а в бакете ожидается до %d ссылок; "
+            "увеличьте CACHE_HASH_BUCKET_BITS или лимит",
+            _listpack_limit(limits, "entries"),
+            expected_fields,
+        )
+
+async def _run_sweeper(interval: float):
+    await _check_listpack_limits()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Бакеты общие для всех воркеров: за интервал очистку выполняет один из них
+            if await async_redis_client.set("lock:cache_sweep", 1, nx=True, ex=max(1, int(interval))):
+                removed = await sweep_hash_cache()
+                logger.info("Очистка кэша ссылок: удалено %d истекших записей", removed)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Ошибка очистки кэша ссылок", exc_info=True)
+
+def start_cache_sweeper(interval: float = CACHE_SWEEP_INTERVAL):
+    global _sweep_task
+    if CACHE_LAYOUT == "hash":
+        _sweep_task = asyncio.create_task(_run_sweeper(interval))
+
+async def stop_cache_sweeper():
+    global _sweep_task
+    if _sweep_task is not None:
+        _sweep_task.cancel()
+        try:
+            await _sweep_task
+        except asyncio.CancelledError:
+            pass
+    _sweep_task = None
+
+async def close_async_cache():
+    await async_redis_pool.disconnect()
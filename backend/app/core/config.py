@@ -1,3 +1,4 @@
+import math
 import os
 from dotenv import load_dotenv
 
@@ -7,4 +8,97 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey123")
 SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
-INACTIVITY_DAYS = int(os.getenv("INACTIVITY_DAYS", "90"))
\ No newline at end of file
+INACTIVITY_DAYS = int(os.getenv("INACTIVITY_DAYS", "90"))
+
+
+def _to_async_url(url):
+    # asyncpg-драйвер для асинхронного движка SQLAlchemy
+    if not url:
+        return url
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _to_async_url(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", "5"))
+CLICK_FLUSH_BATCH_SIZE = int(os.getenv("CLICK_FLUSH_BATCH_SIZE", "1000"))
+L1_CACHE_SIZE = int(os.getenv("L1_CACHE_SIZE", "10000"))
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", "30"))
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+LINK_CACHE_TTL = int(os.getenv("LINK_CACHE_TTL", "3600"))
+SHORT_CODE_STRATEGY = os.getenv("SHORT_CODE_STRATEGY", "sequence")
+SHORT_CODE_LENGTH = int(os.getenv("SHORT_CODE_LENGTH", "6"))
+# Размер блока можно только увеличивать: блоки нумеруются как nextval * SHORT_CODE_BLOCK_SIZE
+SHORT_CODE_BLOCK_SIZE = int(os.getenv("SHORT_CODE_BLOCK_SIZE", "1000"))
+SHORT_CODE_SCRAMBLE = os.getenv("SHORT_CODE_SCRAMBLE", "true").lower() in ("1", "true", "yes")
+SHORT_CODE_SECRET = os.getenv("SHORT_CODE_SECRET", SECRET_KEY)
+SHORT_CODE_POOL_KEY = os.getenv("SHORT_CODE_POOL_KEY", "short_code:pool")
+SHORT_CODE_MAX_ATTEMPTS = int(os.getenv("SHORT_CODE_MAX_ATTEMPTS", "5"))
+LINK_BATCH_MAX_ITEMS = int(os.getenv("LINK_BATCH_MAX_ITEMS", "10000"))
+LINK_BATCH_CHUNK_SIZE = int(os.getenv("LINK_BATCH_CHUNK_SIZE", "1000"))
+LINKS_PAGE_SIZE = int(os.getenv("LINKS_PAGE_SIZE", "100"))
+LINKS_PAGE_MAX_SIZE = int(os.getenv("LINKS_PAGE_MAX_SIZE", "1000"))
+LINKS_STREAM_BATCH_SIZE = int(os.getenv("LINKS_STREAM_BATCH_SIZE", "1000"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "5"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+ROLLUP_HOURLY_RETENTION_DAYS = int(os.getenv("ROLLUP_HOURLY_RETENTION_DAYS", "7"))
+ROLLUP_COMPACT_INTERVAL = float(os.getenv("ROLLUP_COMPACT_INTERVAL", "3600"))
+STATS_DEFAULT_RANGE_DAYS = int(os.getenv("STATS_DEFAULT_RANGE_DAYS", "7"))
+# Очистка удаляет ссылки безвозвратно, поэтому включается явно
+REAPER_ENABLED = os.getenv("REAPER_ENABLED", "false").lower() in ("1", "true", "yes")
+# Истекшая ссылка еще столько дней отвечает 410 и учитывается в сводке, прежде чем ее удалят
+EXPIRED_LINK_GRACE_DAYS = int(os.getenv("EXPIRED_LINK_GRACE_DAYS", "30"))
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "3600"))
+REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", "1000"))
+REAPER_BATCH_PAUSE = float(os.getenv("REAPER_BATCH_PAUSE", "0.05"))
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "10000"))
+WARMUP_TIME_BUDGET = float(os.getenv("WARMUP_TIME_BUDGET", "10"))
+WARMUP_RECENT_DAYS = int(os.getenv("WARMUP_RECENT_DAYS", "7"))
+WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", "1000"))
+AUTO_CREATE_SCHEMA = os.getenv("AUTO_CREATE_SCHEMA", "true").lower() in ("1", "true", "yes")
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+ACCOUNT_DELETE_BATCH_SIZE = int(os.getenv("ACCOUNT_DELETE_BATCH_SIZE", "1000"))
+ACCOUNT_DELETE_BATCH_PAUSE = float(os.getenv("ACCOUNT_DELETE_BATCH_PAUSE", "0.05"))
+ACCOUNT_DELETION_JOB_TTL = int(os.getenv("ACCOUNT_DELETION_JOB_TTL", "86400"))
+LINKS_SUMMARY_TOP_N = int(os.getenv("LINKS_SUMMARY_TOP_N", "10"))
+LINKS_SUMMARY_MAX_TOP_N = int(os.getenv("LINKS_SUMMARY_MAX_TOP_N", "100"))
+UNIQUE_VISITORS_RETENTION_DAYS = int(os.getenv("UNIQUE_VISITORS_RETENTION_DAYS", "90"))
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", "1.0"))
+LINK_LOAD_LOCK_TTL = float(os.getenv("LINK_LOAD_LOCK_TTL", "2"))
+LINK_LOAD_WAIT = float(os.getenv("LINK_LOAD_WAIT", "1"))
+LINK_LOAD_POLL_INTERVAL = float(os.getenv("LINK_LOAD_POLL_INTERVAL", "0.02"))
+# Реплики для чтения через запятую; пусто - все читается с основной БД
+READ_REPLICA_URLS = [url.strip() for url in os.getenv("READ_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_RETRY_INTERVAL = float(os.getenv("REPLICA_RETRY_INTERVAL", "10"))
+READ_YOUR_WRITES_TTL = int(os.getenv("READ_YOUR_WRITES_TTL", "5"))
+READ_PRIMARY_COOKIE = os.getenv("READ_PRIMARY_COOKIE", "read_primary_until")
+LINK_IMPORT_SAMPLE_SIZE = int(os.getenv("LINK_IMPORT_SAMPLE_SIZE", "100"))
+REDIRECT_CACHE_MAX_AGE = int(os.getenv("REDIRECT_CACHE_MAX_AGE", "3600"))
+REDIRECT_PERMANENT_MAX_AGE = int(os.getenv("REDIRECT_PERMANENT_MAX_AGE", "86400"))
+# Раскладка кэша ссылок: keys - ключ link:{code} на ссылку, hash - бакеты lh:{префикс хэша кода}
+CACHE_LAYOUT = os.getenv("CACHE_LAYOUT", "keys")
+# Бакетов столько, чтобы при ожидаемом числе ссылок в кэше в каждом было ~64 поля:
+# с запасом меньше hash-max-listpack-entries (128 по умолчанию)
+CACHE_EXPECTED_LINKS = int(os.getenv("CACHE_EXPECTED_LINKS", "1000000"))
+CACHE_FIELDS_PER_BUCKET = 64
+CACHE_HASH_BUCKET_BITS = int(
+    os.getenv("CACHE_HASH_BUCKET_BITS") or max(1, math.ceil(math.log2(max(CACHE_EXPECTED_LINKS, 1) / CACHE_FIELDS_PER_BUCKET)))
+)
+CACHE_SWEEP_INTERVAL = float(os.getenv("CACHE_SWEEP_INTERVAL", "300"))
+CACHE_SWEEP_BATCH = int(os.getenv("CACHE_SWEEP_BATCH", "500"))
+METRICS_SYNC_INTERVAL = float(os.getenv("METRICS_SYNC_INTERVAL", "5"))
@@ -1,14 +1,169 @@
+import itertools
+import logging
+import time
+
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.core.config import DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from app.core.config import (
+    DATABASE_URL,
+    ASYNC_DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    READ_REPLICA_URLS,
+    REPLICA_RETRY_INTERVAL,
+    READ_YOUR_WRITES_TTL,
+    READ_PRIMARY_COOKIE,
+)
+from app.core.metrics import DB_CHECKOUT_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+
+class _CheckoutTimer:
+    # Ожидание меряется в самом пуле, когда сессии действительно нужно соединение:
+    # зависимость get_db не берет его заранее, до проверки авторизации
+    pool_kind = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_CHECKOUT_WAIT.labels(self.pool_kind).observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(_CheckoutTimer, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_CheckoutTimer, AsyncAdaptedQueuePool):
+    pool_kind = "async"
 
-engine = create_engine(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Асинхронный движок для горячих путей (редирект), чтобы не блокировать event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=TimedAsyncQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+class ReplicaPool:
+    """Реплики для чтения: round-robin по доступным, недоступная пропускается REPLICA_RETRY_INTERVAL секунд."""
+
+    def __init__(self, session_factories: list):
+        self.session_factories = session_factories
+        self._down_until = [0.0] * len(session_factories)
+        self._counter = itertools.count()
+
+    def candidates(self) -> list:
+        if not self.session_factories:
+            return []
+        count = len(self.session_factories)
+        start = next(self._counter)
+        now = time.monotonic()
+        return [index for index in ((start + offset) % count for offset in range(count)) if self._down_until[index] <= now]
+
+    def mark_down(self, index: int):
+        self._down_until[index] = time.monotonic() + REPLICA_RETRY_INTERVAL
+
+
+read_engines = [
+    create_engine(url, poolclass=TimedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True)
+    for url in READ_REPLICA_URLS
+]
+read_replicas = ReplicaPool([sessionmaker(autocommit=False, autoflush=False, bind=e) for e in read_engines])
+
+def init_db():
+    # Импорт моделей регистрирует все таблицы в Base.metadata
+    from app.models import user, link, click_rollup  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    # create_all не меняет существующие таблицы: колонки и индексы, появившиеся позже,
+    # добавляет разовая миграция app/services/schema_migration.py
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def open_read_session():
+    for index in read_replicas.candidates():
+        db = read_replicas.session_factories[index]()
+        try:
+            db.connection()
+            return db
+        except DBAPIError:
+            db.close()
+            read_replicas.mark_down(index)
+            logger.warning("Реплика %s недоступна, читаем с другой", index)
+    # Реплик нет или все недоступны - читаем с основной БД
+    db = SessionLocal()
+    db.connection()
+    return db
+
+def _reads_from_primary(request: Request) -> bool:
+    # Недавно менявший данные клиент читает с основной БД и видит свои изменения
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def get_read_db(request: Request):
+    # Соединение берется сразу, чтобы пропустить недоступную реплику, поэтому в эндпоинтах
+    # эта зависимость идет после get_current_principal: запрос без авторизации не занимает пул
+    if _reads_from_primary(request):
+        db = SessionLocal()
+    else:
+        db = open_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+class ReadYourWritesMiddleware:
+    """После успешного изменяющего запроса ставит cookie, которая на время отправляет чтения на основную БД."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS") or not READ_REPLICA_URLS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = int(time.time()) + READ_YOUR_WRITES_TTL
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{READ_PRIMARY_COOKIE}={until}; Max-Age={READ_YOUR_WRITES_TTL}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+async def dispose_engines():
+    for read_engine in read_engines:
+        read_engine.dispose()
+    await async_engine.dispose()
+    engine.dispose()
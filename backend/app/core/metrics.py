@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from app.core.config import METRICS_SYNC_INTERVAL
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"],
+)
+REDIRECT_LATENCY = Histogram(
+    "redirect_duration_seconds",
+    "Время редиректа по короткой ссылке в разрезе источника данных",
+    ["source"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+DB_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Ожидание соединения из пула SQLAlchemy",
+    ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+CLICK_FLUSH_ERRORS = Counter("click_flush_errors_total", "Неудачные сбросы буфера переходов")
+
+# Дочерние метрики горячего пути создаются один раз, чтобы не искать их по меткам на каждый запрос
+REDIRECT_FROM_CACHE = REDIRECT_LATENCY.labels("cache")
+REDIRECT_FROM_DB = REDIRECT_LATENCY.labels("db")
+
+
+class MetricsMiddleware:
+    # Чистый ASGI-middleware: без BaseHTTPMiddleware и лишних копий ответа
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], route.path if route else "unmatched", status_code
+            ).observe(time.perf_counter() - started)
+
+
+# Показатели процесса: на горячем пути это обычные int, в метрики они копируются
+# при запросе /metrics и периодически (для остальных воркеров gunicorn)
+CACHE_REQUESTS = Counter("cache_requests", "Обращения к кэшу ссылок", ["layer", "result"])
+CACHE_L1_EVICTIONS = Counter("cache_l1_evictions", "Вытеснения из L1-кэша")
+CACHE_L1_SIZE = Gauge("cache_l1_size", "Записей в L1-кэше", multiprocess_mode="livesum")
+DB_POOL_SIZE = Gauge("db_pool_size", "Размер пула SQLAlchemy", ["engine"], multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Выданные соединения пула", ["engine"], multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Соединения сверх pool_size", ["engine"], multiprocess_mode="livesum")
+CLICK_BUFFER_PENDING = Gauge("click_buffer_pending", "Коды с несохраненными переходами", multiprocess_mode="livesum")
+PASSWORD_JOBS_PENDING = Gauge("password_jobs_pending", "Задачи bcrypt в очереди пула процессов", multiprocess_mode="livesum")
+
+_synced_counts = {}
+_sync_task: Optional[asyncio.Task] = None
+
+def _inc_to(counter, key, value: int):
+    # Счетчик процесса мог обнулиться (очистка статистики) - тогда просто запоминаем новое значение
+    delta = value - _synced_counts.get(key, 0)
+    if delta > 0:
+        counter.inc(delta)
+    _synced_counts[key] = value
+
+def sync_runtime_metrics():
+    from app.core.cache import local_cache, cache_stats
+    from app.core.database import engine, async_engine, read_engines
+    from app.core import security
+    from app.services import analytics
+
+    l1 = local_cache.stats()
+    _inc_to(CACHE_REQUESTS.labels("l1", "hit"), "l1_hit", l1["hits"])
+    _inc_to(CACHE_REQUESTS.labels("l1", "miss"), "l1_miss", l1["misses"])
+    _inc_to(CACHE_REQUESTS.labels("redis", "hit"), "redis_hit", cache_stats["redis_hits"])
+    _inc_to(CACHE_REQUESTS.labels("redis", "miss"), "redis_miss", cache_stats["redis_misses"])
+    _inc_to(CACHE_L1_EVICTIONS, "l1_evictions", l1["evictions"])
+    CACHE_L1_SIZE.set(l1["size"])
+
+    # Асинхронный пул обслуживает промахи кэша на редиректе, его нагрузка видна отдельно
+    pools = [("primary", engine.pool), ("primary_async", async_engine.sync_engine.pool)]
+    pools += [(f"replica{index}", read_engine.pool) for index, read_engine in enumerate(read_engines)]
+    for name, pool in pools:
+        DB_POOL_SIZE.labels(name).set(pool.size())
+        DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        DB_POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+
+    CLICK_BUFFER_PENDING.set(analytics.pending_clicks())
+    PASSWORD_JOBS_PENDING.set(security._password_jobs)
+
+def is_multiprocess() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+async def _run_sync(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        sync_runtime_metrics()
+
+def start_metrics_sync(interval: float = METRICS_SYNC_INTERVAL):
+    # Без gunicorn /metrics отдает тот же процесс, и хватает синхронизации при запросе
+    global _sync_task
+    if is_multiprocess():
+        _sync_task = asyncio.create_task(_run_sync(interval))
+
+async def stop_metrics_sync():
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        try:
+            await _sync_task
+        except asyncio.CancelledError:
+            pass
+    _sync_task = None
+
+def render_metrics():
+    sync_runtime_metrics()
+    if not is_multiprocess():
+        return generate_latest(), CONTENT_TYPE_LATEST
+    # Под gunicorn складываем значения всех воркеров из PROMETHEUS_MULTIPROC_DIR
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
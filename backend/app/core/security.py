@@ -1,14 +1,52 @@
+import asyncio
+import multiprocessing
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, Tuple
+
+import redis
 from passlib.context import CryptContext
 from fastapi import HTTPException, Request, Depends
 from sqlalchemy.orm import Session
 
 from app.models.user import User
-from app.core.database import get_db
-from app.core.config import SESSION_TTL
-from app.core.cache import redis_client
+from app.core.database import get_db, SessionLocal
+from app.core.config import (
+    SESSION_TTL,
+    PRINCIPAL_CACHE_SIZE,
+    PRINCIPAL_CACHE_TTL,
+    BCRYPT_ROUNDS,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_MAX_PENDING,
+)
+from app.core.cache import redis_client, LocalCache, register_local_cache, publish_invalidation
+
+# Хэши с другой стоимостью считаются устаревшими и перехэшируются при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# Версия формата сессии: при несовпадении принципал перечитывается из БД
+PRINCIPAL_VERSION = 1
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+class Principal(NamedTuple):
+    id: int
+    username: str
+    is_admin: bool
+    version: int
+
+
+principal_cache = LocalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+register_local_cache(principal_cache)
+
+# bcrypt держит GIL ~250 мс, поэтому считаем его в отдельных процессах
+_password_executor: Optional[ProcessPoolExecutor] = None
+_password_jobs = 0
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -16,26 +54,145 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def create_session(user_id: int) -> str:
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def _get_password_executor() -> ProcessPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _password_executor
+
+async def _run_password_job(func, *args):
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"},
+        )
+    _password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_password_executor(), func, *args)
+    finally:
+        _password_jobs -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_job(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # Второй элемент - новый хэш, если параметры стоимости изменились
+    return await _run_password_job(_verify_and_update, plain_password, hashed_password)
+
+def shutdown_password_executor():
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+def _session_key(session_token: str) -> str:
+    return f"session:{session_token}"
+
+def _user_sessions_key(user_id: int) -> str:
+    return f"user_sessions:{user_id}"
+
+def _write_session(session_token: str, user: User, ttl: int = SESSION_TTL):
+    key = _session_key(session_token)
+    pipe = redis_client.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping={
+        "id": user.id,
+        "username": user.username,
+        "is_admin": int(bool(user.is_admin)),
+        "ver": PRINCIPAL_VERSION,
+    })
+    pipe.expire(key, ttl)
+    pipe.sadd(_user_sessions_key(user.id), session_token)
+    pipe.expire(_user_sessions_key(user.id), SESSION_TTL)
+    pipe.execute()
+
+def create_session(user: User) -> str:
     session_token = str(uuid.uuid4())
-    redis_client.setex(f"session:{session_token}", SESSION_TTL, user_id)
+    _write_session(session_token, user)
     return session_token
 
+def _forget_session(session_token: str):
+    key = _session_key(session_token)
+    principal_cache.delete(key)
+    publish_invalidation(key)
+
 def delete_session(session_token: str):
-    redis_client.delete(f"session:{session_token}")
+    key = _session_key(session_token)
+    try:
+        user_id = redis_client.hget(key, "id")
+    except redis.ResponseError:
+        user_id = None
+    pipe = redis_client.pipeline()
+    pipe.delete(key)
+    if user_id:
+        pipe.srem(_user_sessions_key(user_id), session_token)
+    pipe.execute()
+    _forget_session(session_token)
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+def revoke_user_sessions(user_id: int):
+    index_key = _user_sessions_key(user_id)
+    tokens = redis_client.smembers(index_key)
+    pipe = redis_client.pipeline()
+    for session_token in tokens:
+        pipe.delete(_session_key(session_token))
+    pipe.delete(index_key)
+    pipe.execute()
+    for session_token in tokens:
+        _forget_session(session_token)
+
+def _reload_principal(session_token: str, user_id) -> Principal:
+    # Сессия старого формата: перечитываем пользователя и переписываем ее в хэш
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Некорректная сессия")
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+    finally:
+        db.close()
+    if not user:
+        raise HTTPException(status_code=401, detail="Пользователь не найден")
+    ttl = redis_client.ttl(_session_key(session_token))
+    _write_session(session_token, user, ttl if ttl > 0 else SESSION_TTL)
+    return Principal(user.id, user.username, bool(user.is_admin), PRINCIPAL_VERSION)
+
+def get_current_principal(request: Request) -> Principal:
     session_token = request.cookies.get("session_id")
     if not session_token:
         raise HTTPException(status_code=401, detail="Не авторизован")
-    user_id = redis_client.get(f"session:{session_token}")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Сессия недействительна или истекла")
+    key = _session_key(session_token)
+    principal = principal_cache.get(key)
+    if principal:
+        return principal
     try:
-        user_id = int(user_id)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Некорректная сессия")
-    user = db.query(User).filter(User.id == user_id).first()
+        data = redis_client.hgetall(key)
+    except redis.ResponseError:
+        # До хранения принципала в хэше сессия была строкой с id пользователя
+        principal = _reload_principal(session_token, redis_client.get(key))
+    else:
+        if not data:
+            raise HTTPException(status_code=401, detail="Сессия недействительна или истекла")
+        try:
+            principal = Principal(int(data["id"]), data["username"], data["is_admin"] == "1", int(data["ver"]))
+        except (KeyError, ValueError):
+            raise HTTPException(status_code=401, detail="Некорректная сессия")
+        if principal.version != PRINCIPAL_VERSION:
+            principal = _reload_principal(session_token, principal.id)
+    principal_cache.set(key, principal)
+    return principal
+
+def get_current_user(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_db)) -> User:
+    user = db.query(User).filter(User.id == principal.id).first()
     if not user:
         raise HTTPException(status_code=401, detail="Пользователь не найден")
-    return user
\ No newline at end of file
+    return user
@@ -1,34 +1,107 @@
-import asyncio
-from datetime import datetime, timezone
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.api import auth, links
-from app.core.cache import get_url_from_cache, set_url_to_cache
-from app.core.database import engine, Base, get_db
-from app.models.link import Link
-from app.services.analytics import update_link_stats
+from app.core.cache import (
+    get_url_from_cache_async,
+    start_cache_invalidation_listener,
+    stop_cache_invalidation_listener,
+    start_cache_sweeper,
+    stop_cache_sweeper,
+    close_async_cache,
+)
+from app.core.database import init_db, dispose_engines, ReadYourWritesMiddleware
+from app.core.security import shutdown_password_executor
+from app.core.metrics import (
+    MetricsMiddleware,
+    REDIRECT_FROM_CACHE,
+    REDIRECT_FROM_DB,
+    render_metrics,
+    start_metrics_sync,
+    stop_metrics_sync,
+)
+from app.services.analytics import record_click, visitor_fingerprint, start_click_flusher, stop_click_flusher
+from app.services.reaper import start_reaper, stop_reaper
+from app.services.account_deletion import stop_account_deletions
+from app.services.link_loader import load_link, refresh_link_if_due, stop_link_loads
+from app.services.warmup import warm_cache_within_budget
+from app.core.config import (
+    REAPER_ENABLED,
+    WARMUP_ON_STARTUP,
+    AUTO_CREATE_SCHEMA,
+    REDIRECT_CACHE_MAX_AGE,
+    REDIRECT_PERMANENT_MAX_AGE,
+)
+from app.schemas.link import PERMANENT_REDIRECT_CODES
 
-app = FastAPI(title="URL Shortener API", version="1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # В продакшене схему один раз создает app/server.py до запуска воркеров
+    if AUTO_CREATE_SCHEMA:
+        await run_in_threadpool(init_db)
+    # Остановка идет в обратном порядке, и ошибка одного шага (например, БД недоступна
+    # при сбросе переходов) не мешает закрыть остальное
+    async with AsyncExitStack() as stack:
+        stack.push_async_callback(dispose_engines)
+        stack.push_async_callback(close_async_cache)
+        stack.callback(shutdown_password_executor)
+        start_metrics_sync()
+        stack.push_async_callback(stop_metrics_sync)
+        start_cache_sweeper()
+        stack.push_async_callback(stop_cache_sweeper)
+        start_cache_invalidation_listener()
+        stack.push_async_callback(stop_cache_invalidation_listener)
+        start_click_flusher()
+        # Остановка флашера сбрасывает в БД все накопленные переходы
+        stack.push_async_callback(stop_click_flusher)
+        stack.push_async_callback(stop_link_loads)
+        stack.push_async_callback(stop_account_deletions)
+        if REAPER_ENABLED:
+            start_reaper()
+        stack.push_async_callback(stop_reaper)
+        if WARMUP_ON_STARTUP:
+            await warm_cache_within_budget()
+        yield
 
-# Создаем таблицы, если они еще не созданы
-Base.metadata.create_all(bind=engine)
+app = FastAPI(title="URL Shortener API", version="1.0", lifespan=lifespan)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(links.router, prefix="/api/links", tags=["links"])
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
+
 @app.get("/{short_code}", include_in_schema=False)
-async def redirect_short_url(short_code: str):
-    db = next(get_db())
-    original_url = get_url_from_cache(short_code)
-    if not original_url:
-        link = db.query(Link).filter(Link.short_code == short_code).first()
-        if not link:
+async def redirect_short_url(short_code: str, request: Request):
+    started = time.perf_counter()
+    observer = REDIRECT_FROM_CACHE
+    cached = await get_url_from_cache_async(short_code)
+    if cached is None:
+        # Одновременные промахи по одному коду ждут одну загрузку из БД
+        observer = REDIRECT_FROM_DB
+        cached = await load_link(short_code)
+        if cached is None:
             raise HTTPException(status_code=404, detail="Ссылка не найдена")
-        if link.expires_at and link.expires_at < datetime.now(timezone.utc):
-            raise HTTPException(status_code=410, detail="Ссылка устарела")
-        original_url = link.original_url
-        set_url_to_cache(short_code, original_url, ttl=3600)
-    asyncio.create_task(update_link_stats(short_code))
-    return RedirectResponse(url=original_url, status_code=302)
\ No newline at end of file
+    else:
+        refresh_link_if_due(short_code, cached)
+    if cached.is_expired():
+        raise HTTPException(status_code=410, detail="Ссылка устарела")
+    client_ip = request.client.host if request.client else None
+    record_click(short_code, visitor_fingerprint(client_ip, request.headers.get("user-agent")))
+    observer.observe(time.perf_counter() - started)
+    response = RedirectResponse(url=cached.url, status_code=cached.redirect_code)
+    if cached.exact_clicks:
+        # Каждый переход должен дойти до сервиса и попасть в статистику
+        response.headers["Cache-Control"] = "no-store"
+    else:
+        limit = REDIRECT_PERMANENT_MAX_AGE if cached.redirect_code in PERMANENT_REDIRECT_CODES else REDIRECT_CACHE_MAX_AGE
+        response.headers["Cache-Control"] = f"public, max-age={cached.max_age(limit)}"
+    return response
\ No newline at end of file
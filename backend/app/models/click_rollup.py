@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from app.core.database import Base
+
+class LinkClickRollup(Base):
+    # Часовые корзины; старше ROLLUP_HOURLY_RETENTION_DAYS сворачиваются в дневные,
+    # которые хранятся в корзине полуночи (UTC) того же дня
+    __tablename__ = "link_click_rollup"
+
+    link_id = Column(Integer, ForeignKey("link.id", ondelete="CASCADE"), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    clicks = Column(Integer, nullable=False, default=0)
\ No newline at end of file
@@ -1,17 +1,39 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, SmallInteger, String, Boolean, DateTime, ForeignKey, Sequence, Index, false, text
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from app.core.database import Base
+from app.services.url_index import hash_url
+
+# Номера блоков для выдачи коротких кодов без проверок в БД (app/services/allocator.py)
+link_short_code_seq = Sequence("link_short_code_seq", metadata=Base.metadata)
 
 class Link(Base):
     __tablename__ = "link"
-    
+    __table_args__ = (
+        # Keyset-пагинация списка ссылок пользователя: WHERE created_by_id = ? AND id > ? ORDER BY id
+        Index("ix_link_created_by_id_id", "created_by_id", "id"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     original_url = Column(String, nullable=False)
+    # SHA-256 нормализованного URL для поиска по оригинальному URL без seq scan
+    url_hash = Column(String(64), index=True, nullable=True)
     short_code = Column(String(20), unique=True, index=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    expires_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=True)
     last_accessed = Column(DateTime(timezone=True), nullable=True)
     access_count = Column(Integer, default=0)
+    # Политика редиректа: 301/308 постоянный, 302/307 временный
+    redirect_code = Column(SmallInteger, nullable=False, default=302, server_default=text("302"))
+    # Не кэшировать редирект в браузере/CDN, чтобы каждый переход доходил до сервиса
+    exact_clicks = Column(Boolean, nullable=False, default=False, server_default=false())
     created_by_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    created_by = relationship("User", back_populates="link")
\ No newline at end of file
+    created_by = relationship("User", back_populates="link")
+
+    @validates("original_url")
+    def _set_url_hash(self, key, value):
+        self.url_hash = hash_url(value)
+        return value
+
+# Поиск неактивных ссылок фоновой очисткой (app/services/reaper.py)
+Index("ix_link_idle_since", func.coalesce(Link.last_accessed, Link.created_at))
\ No newline at end of file
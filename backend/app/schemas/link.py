@@ -1,7 +1,17 @@
-from pydantic import BaseModel, AnyHttpUrl
-from typing import Optional
+from pydantic import BaseModel, AnyHttpUrl, Field, root_validator
+from typing import List, Literal, Optional
 from datetime import datetime
 
+from app.core.config import LINK_BATCH_MAX_ITEMS
+
+RedirectCode = Literal[301, 302, 307, 308]
+PERMANENT_REDIRECT_CODES = (301, 308)
+
+def check_redirect_policy(redirect_code: int, exact_clicks: bool):
+    # Постоянный редирект браузер кэширует сам, и переходы мимо сервиса не посчитать
+    if exact_clicks and redirect_code in PERMANENT_REDIRECT_CODES:
+        raise ValueError("Точный подсчет переходов несовместим с постоянным редиректом")
+
 class LinkBase(BaseModel):
     original_url: AnyHttpUrl
 
@@ -9,11 +19,33 @@ class LinkCreate(LinkBase):
     custom_alias: Optional[str] = None
     expires_in_days: Optional[int] = None
     expires_at: Optional[datetime] = None
+    redirect_code: RedirectCode = 302
+    exact_clicks: bool = False
+
+    @root_validator(skip_on_failure=True)
+    def _check_redirect_policy(cls, values):
+        check_redirect_policy(values["redirect_code"], values["exact_clicks"])
+        return values
+
+class LinkBatchCreate(BaseModel):
+    items: List[LinkCreate] = Field(..., min_items=1, max_items=LINK_BATCH_MAX_ITEMS)
+    warm_cache: bool = False
+
+class LinkBatchItemResult(BaseModel):
+    index: int
+    short_code: Optional[str] = None
+    error: Optional[str] = None
+
+class LinkBatchOut(BaseModel):
+    created: int
+    results: List[LinkBatchItemResult]
 
 class LinkUpdate(BaseModel):
     original_url: Optional[AnyHttpUrl] = None
     expires_in_days: Optional[int] = None
     expires_at: Optional[datetime] = None
+    redirect_code: Optional[RedirectCode] = None
+    exact_clicks: Optional[bool] = None
 
 class LinkOut(LinkBase):
     id: int
@@ -22,15 +54,45 @@ class LinkOut(LinkBase):
     expires_at: Optional[datetime] = None
     last_accessed: Optional[datetime] = None
     access_count: int
+    redirect_code: int
+    exact_clicks: bool
 
     class Config:
         orm_mode = True
 
+class ClickBucket(BaseModel):
+    bucket_start: datetime
+    clicks: int
+
 class LinkStats(BaseModel):
     original_url: AnyHttpUrl
     created_at: datetime
     access_count: int
     last_accessed: Optional[datetime] = None
+    # Оценка HyperLogLog (погрешность ~0.8%) за период from/to с точностью до дня
+    unique_visitors: Optional[int] = None
+    series: Optional[List[ClickBucket]] = None
+
+class LinkSummaryItem(BaseModel):
+    short_code: str
+    original_url: AnyHttpUrl
+    access_count: int
+    last_accessed: Optional[datetime] = None
+
+class LinkSummary(BaseModel):
+    total_links: int
+    total_clicks: int
+    active_links: int
+    expired_links: int
+    top: List[LinkSummaryItem]
+
+class LinkImportOut(BaseModel):
+    rows: int
+    inserted: int
+    conflicts: int
+    invalid: int
+    conflict_sample: List[str]
+    invalid_lines: List[int]
 
 class LinkSearchOut(BaseModel):
     short_code: str
@@ -0,0 +1,74 @@
+"""Запуск в продакшене: gunicorn + воркеры uvicorn (uvloop, httptools).
+
+    python -m app.server
+
+Схема БД создается один раз в мастер-процессе, приложение импортируется до
+форка (preload), а воркеры останавливаются через lifespan с дренажом статистики.
+Метрики воркеров пишутся в PROMETHEUS_MULTIPROC_DIR и складываются при запросе /metrics.
+"""
+import os
+import shutil
+
+# До импорта app.*: воркеры не должны повторно создавать схему,
+# а prometheus_client выбирает режим хранения значений при импорте
+os.environ["AUTO_CREATE_SCHEMA"] = "false"
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/urlshort_metrics")
+
+from gunicorn.app.base import BaseApplication
+from prometheus_client import multiprocess
+from uvicorn.workers import UvicornWorker
+
+from app.core.config import HOST, PORT, WEB_CONCURRENCY, GRACEFUL_TIMEOUT
+from app.core.database import engine, init_db
+
+
+class ProductionWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app.main import app
+
+        return app
+
+
+def child_exit(server, worker):
+    # Gauge умершего воркера не должны попадать в сумму
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def _reset_metrics_dir():
+    # Файлы прошлого запуска исказили бы счетчики
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def main():
+    _reset_metrics_dir()
+    init_db()
+    # Соединения мастера не должны достаться форкнутым воркерам
+    engine.dispose()
+    Server({
+        "bind": f"{HOST}:{PORT}",
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "app.server.ProductionWorker",
+        "preload_app": True,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "timeout": GRACEFUL_TIMEOUT * 2,
+        "keepalive": 5,
+        "child_exit": child_exit,
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from starlette.concurrency import run_in_threadpool
+
+from app.core.cache import async_redis_client, delete_url_caches_async, close_async_cache
+from app.core.config import ACCOUNT_DELETE_BATCH_SIZE, ACCOUNT_DELETE_BATCH_PAUSE, ACCOUNT_DELETION_JOB_TTL
+from app.core.database import AsyncSessionLocal, async_engine
+from app.core.security import revoke_user_sessions
+from app.models.link import Link
+from app.models.user import User
+from app.services.reaper import delete_links_batch
+
+logger = logging.getLogger(__name__)
+
+_deletion_tasks = set()
+
+def _job_key(job_id: str) -> str:
+    return f"account_deletion:{job_id}"
+
+def _user_job_key(user_id: int) -> str:
+    return f"account_deletion:user:{user_id}"
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+async def is_account_being_deleted(user_id: int) -> bool:
+    return bool(await async_redis_client.exists(_user_job_key(user_id)))
+
+async def get_deletion_job(job_id: str) -> Optional[dict]:
+    job = await async_redis_client.hgetall(_job_key(job_id))
+    if not job:
+        return None
+    job["job_id"] = job_id
+    for field in ("user_id", "total", "deleted"):
+        job[field] = int(job[field])
+    return job
+
+async def start_account_deletion(user_id: int) -> str:
+    # Метка ставится до отзыва сессий, чтобы параллельный вход уже был заблокирован
+    job_id = uuid.uuid4().hex
+    if not await async_redis_client.set(_user_job_key(user_id), job_id, nx=True, ex=ACCOUNT_DELETION_JOB_TTL):
+        return await async_redis_client.get(_user_job_key(user_id))
+    async with AsyncSessionLocal() as db:
+        total = (await db.execute(
+            select(func.count()).select_from(Link).where(Link.created_by_id == user_id)
+        )).scalar_one()
+    pipe = async_redis_client.pipeline()
+    pipe.hset(_job_key(job_id), mapping={
+        "user_id": user_id,
+        "status": "running",
+        "total": total,
+        "deleted": 0,
+        "started_at": _now(),
+    })
+    pipe.expire(_job_key(job_id), ACCOUNT_DELETION_JOB_TTL)
+    await pipe.execute()
+    await run_in_threadpool(revoke_user_sessions, user_id)
+    return job_id
+
+async def _purge(job_id: str, rows):
+    await delete_url_caches_async([row.short_code for row in rows], [row.url_hash for row in rows])
+    await async_redis_client.hincrby(_job_key(job_id), "deleted", len(rows))
+
+async def run_account_deletion(
+    job_id: str,
+    user_id: int,
+    batch_size: int = ACCOUNT_DELETE_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+) -> bool:
+    """Удаляет ссылки пачками; возвращает True, если аккаунт удален полностью."""
+    batches = 0
+    while True:
+        if max_batches is not None and batches >= max_batches:
+            return False
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(delete_links_batch(Link.created_by_id == user_id, batch_size))).all()
+            await db.commit()
+        batches += 1
+        if rows:
+            await _purge(job_id, rows)
+        if len(rows) < batch_size:
+            break
+        await asyncio.sleep(ACCOUNT_DELETE_BATCH_PAUSE)
+
+    # Остаток (строки, пропущенные из-за блокировок) удаляется вместе с пользователем
+    table = Link.__table__
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            delete(table).where(table.c.created_by_id == user_id).returning(table.c.short_code, table.c.url_hash)
+        )).all()
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+    if rows:
+        await _purge(job_id, rows)
+    pipe = async_redis_client.pipeline()
+    pipe.hset(_job_key(job_id), mapping={"status": "done", "finished_at": _now()})
+    pipe.delete(_user_job_key(user_id))
+    await pipe.execute()
+    return True
+
+async def _abort_job(job_id: str, user_id: int, **fields):
+    # Снимаем блокировку входа, чтобы пользователь мог повторить удаление
+    pipe = async_redis_client.pipeline()
+    pipe.hset(_job_key(job_id), mapping={**fields, "finished_at": _now()})
+    pipe.delete(_user_job_key(user_id))
+    await pipe.execute()
+
+async def _run_in_background(job_id: str, user_id: int):
+    try:
+        await run_account_deletion(job_id, user_id)
+    except asyncio.CancelledError:
+        # Остановка сервера: уже удаленные пачки не возвращаются, остаток удаляется повторным запросом
+        logger.warning("Удаление аккаунта %s прервано, задача %s", user_id, job_id)
+        await _abort_job(job_id, user_id, status="interrupted")
+        raise
+    except Exception as exc:
+        logger.exception("Удаление аккаунта %s завершилось с ошибкой", user_id)
+        await _abort_job(job_id, user_id, status="failed", error=str(exc))
+
+def schedule_account_deletion(job_id: str, user_id: int):
+    task = asyncio.create_task(_run_in_background(job_id, user_id))
+    _deletion_tasks.add(task)
+    task.add_done_callback(_deletion_tasks.discard)
+
+async def stop_account_deletions():
+    tasks = list(_deletion_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _main(args):
+    # Продолжение прерванного удаления: python -m app.services.account_deletion --user-id 42
+    try:
+        job_id = await start_account_deletion(args.user_id)
+        await run_account_deletion(job_id, args.user_id, args.batch_size)
+        print(await get_deletion_job(job_id))
+    finally:
+        await close_async_cache()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Удаление аккаунта пользователя со всеми ссылками")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--batch-size", type=int, default=ACCOUNT_DELETE_BATCH_SIZE)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
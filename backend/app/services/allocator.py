@@ -0,0 +1,123 @@
+import hashlib
+import threading
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.cache import redis_client
+from app.core.config import (
+    SHORT_CODE_STRATEGY,
+    SHORT_CODE_LENGTH,
+    SHORT_CODE_BLOCK_SIZE,
+    SHORT_CODE_SCRAMBLE,
+    SHORT_CODE_SECRET,
+    SHORT_CODE_POOL_KEY,
+)
+from app.models.link import Link, link_short_code_seq
+from app.services.shortener import generate_short_code, code_from_id
+
+
+class ShortCodeAllocator:
+    """Выдает короткие коды без поиска свободного кода в БД на каждую ссылку.
+
+    Окончательную уникальность гарантирует индекс на link.short_code:
+    при редкой коллизии (например, с кастомным alias) код запрашивается заново.
+    """
+
+    def allocate(self, db: Session) -> str:
+        return self.allocate_many(db, 1)[0]
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        raise NotImplementedError
+
+
+class RandomAllocator(ShortCodeAllocator):
+    def __init__(self, length: int):
+        self.length = length
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        return [generate_short_code(self.length) for _ in range(count)]
+
+
+class SequenceAllocator(ShortCodeAllocator):
+    """Коды из номеров, зарезервированных блоками через последовательность Postgres."""
+
+    def __init__(self, block_size: int, length: int, key: Optional[bytes]):
+        self.block_size = block_size
+        self.length = length
+        self.key = key
+        self._blocks = []
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _reserve_blocks(self, db: Session, count: int):
+        result = db.execute(
+            select(link_short_code_seq.next_value()).select_from(func.generate_series(1, count))
+        )
+        for block in result.scalars():
+            self._blocks.append(block * self.block_size)
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    if not self._blocks:
+                        missing = count - len(numbers)
+                        self._reserve_blocks(db, -(-missing // self.block_size))
+                    self._next = self._blocks.pop(0)
+                    self._end = self._next + self.block_size
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        return [code_from_id(number, self.length, self.key) for number in numbers]
+
+
+class PoolAllocator(ShortCodeAllocator):
+    """Коды из заранее сгенерированного пула свободных кодов в Redis (SPOP блоками)."""
+
+    def __init__(self, block_size: int, length: int, pool_key: str):
+        self.block_size = block_size
+        self.length = length
+        self.pool_key = pool_key
+        self._codes = []
+        self._lock = threading.Lock()
+
+    def refill(self, db: Session, amount: int) -> int:
+        candidates = list({generate_short_code(self.length) for _ in range(amount)})
+        taken = set(db.execute(select(Link.short_code).where(Link.short_code.in_(candidates))).scalars())
+        free = [code for code in candidates if code not in taken]
+        if free:
+            redis_client.sadd(self.pool_key, *free)
+        return len(free)
+
+    def allocate_many(self, db: Session, count: int) -> List[str]:
+        with self._lock:
+            while len(self._codes) < count:
+                need = max(self.block_size, count - len(self._codes))
+                codes = redis_client.spop(self.pool_key, need) or []
+                self._codes.extend(codes)
+                if len(codes) < need and not self.refill(db, need * 10):
+                    raise RuntimeError("Пул коротких кодов исчерпан")
+            result = self._codes[:count]
+            del self._codes[:count]
+        return result
+
+
+_allocator: Optional[ShortCodeAllocator] = None
+
+def get_allocator() -> ShortCodeAllocator:
+    global _allocator
+    if _allocator is None:
+        if SHORT_CODE_STRATEGY == "sequence":
+            key = hashlib.sha256(SHORT_CODE_SECRET.encode()).digest() if SHORT_CODE_SCRAMBLE else None
+            _allocator = SequenceAllocator(SHORT_CODE_BLOCK_SIZE, SHORT_CODE_LENGTH, key)
+        elif SHORT_CODE_STRATEGY == "pool":
+            _allocator = PoolAllocator(SHORT_CODE_BLOCK_SIZE, SHORT_CODE_LENGTH, SHORT_CODE_POOL_KEY)
+        elif SHORT_CODE_STRATEGY == "random":
+            _allocator = RandomAllocator(SHORT_CODE_LENGTH)
+        else:
+            raise ValueError(f"Неизвестная стратегия SHORT_CODE_STRATEGY: {SHORT_CODE_STRATEGY}")
+    return _allocator
@@ -1,22 +1,238 @@
 import asyncio
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
-from app.models.link import Link
+from app.core.config import (
+    CLICK_FLUSH_INTERVAL,
+    CLICK_FLUSH_BATCH_SIZE,
+    ROLLUP_HOURLY_RETENTION_DAYS,
+    ROLLUP_COMPACT_INTERVAL,
+    SECRET_KEY,
+    UNIQUE_VISITORS_RETENTION_DAYS,
+)
+from app.core.cache import redis_client, async_redis_client
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import CLICK_FLUSH_ERRORS
+from app.models.click_rollup import LinkClickRollup
+
+logger = logging.getLogger(__name__)
+
+# Накопленные переходы: short_code -> [количество, время последнего перехода]
+_pending: Dict[str, list] = {}
+# Переходы по часовым корзинам: (short_code, начало часа) -> количество
+_pending_buckets: Dict[Tuple[str, datetime], int] = {}
+# Отпечатки посетителей по HLL-ключам: hll:{short_code}:{YYYYMMDD} -> множество отпечатков
+_pending_visitors: Dict[str, Set[str]] = {}
+_flush_event: Optional[asyncio.Event] = None
+_flusher_task: Optional[asyncio.Task] = None
+_last_compaction = 0.0
+
+# Одно UPDATE на пачку кодов вместо транзакции на каждый переход
+_FLUSH_SQL = text("""
+    UPDATE link SET
+        access_count = COALESCE(link.access_count, 0) + clicks.delta,
+        last_accessed = GREATEST(link.last_accessed, clicks.last_accessed)
+    FROM unnest(
+        CAST(:codes AS VARCHAR[]),
+        CAST(:deltas AS INTEGER[]),
+        CAST(:lasts AS TIMESTAMPTZ[])
+    ) AS clicks(short_code, delta, last_accessed)
+    WHERE link.short_code = clicks.short_code
+""")
+
+_ROLLUP_SQL = text("""
+    INSERT INTO link_click_rollup (link_id, bucket_start, clicks)
+    SELECT link.id, buckets.bucket_start, buckets.clicks
+    FROM unnest(
+        CAST(:codes AS VARCHAR[]),
+        CAST(:buckets AS TIMESTAMPTZ[]),
+        CAST(:counts AS INTEGER[])
+    ) AS buckets(short_code, bucket_start, clicks)
+    JOIN link ON link.short_code = buckets.short_code
+    ON CONFLICT (link_id, bucket_start)
+    DO UPDATE SET clicks = link_click_rollup.clicks + EXCLUDED.clicks
+""")
+
+# Часовые корзины старше cutoff переносятся в корзину полуночи своего дня
+_COMPACT_SQL = text("""
+    WITH moved AS (
+        DELETE FROM link_click_rollup
+        WHERE bucket_start < :cutoff
+          AND bucket_start <> date_trunc('day', bucket_start, 'UTC')
+        RETURNING link_id, bucket_start, clicks
+    )
+    INSERT INTO link_click_rollup (link_id, bucket_start, clicks)
+    SELECT link_id, date_trunc('day', bucket_start, 'UTC'), SUM(clicks)
+    FROM moved
+    GROUP BY 1, 2
+    ON CONFLICT (link_id, bucket_start)
+    DO UPDATE SET clicks = link_click_rollup.clicks + EXCLUDED.clicks
+""")
+
+def _merge(short_code: str, count: int, last_accessed: datetime):
+    entry = _pending.get(short_code)
+    if entry is None:
+        _pending[short_code] = [count, last_accessed]
+    else:
+        entry[0] += count
+        if last_accessed > entry[1]:
+            entry[1] = last_accessed
+
+def _merge_bucket(key: Tuple[str, datetime], count: int):
+    _pending_buckets[key] = _pending_buckets.get(key, 0) + count
+
+def _visitors_key(short_code: str, day) -> str:
+    return f"hll:{short_code}:{day:%Y%m%d}"
+
+def visitor_fingerprint(client_ip: Optional[str], user_agent: Optional[str]) -> str:
+    # Сырые IP в Redis не попадают: храним только хэш с секретом
+    data = f"{client_ip or ''}|{user_agent or ''}".encode()
+    return hashlib.blake2b(data, digest_size=8, key=SECRET_KEY.encode()[:64]).hexdigest()
+
+def record_click(short_code: str, fingerprint: Optional[str] = None):
+    now = datetime.now(timezone.utc)
+    _merge(short_code, 1, now)
+    _merge_bucket((short_code, now.replace(minute=0, second=0, microsecond=0)), 1)
+    if fingerprint:
+        _pending_visitors.setdefault(_visitors_key(short_code, now), set()).add(fingerprint)
+    if _flush_event is not None and len(_pending) >= CLICK_FLUSH_BATCH_SIZE:
+        _flush_event.set()
+
+def pending_clicks() -> int:
+    return len(_pending)
+
+async def _write_batch(batch: list, bucket_batch: list):
+    async with AsyncSessionLocal() as db:
+        if batch:
+            await db.execute(_FLUSH_SQL, {
+                "codes": [code for code, _ in batch],
+                "deltas": [count for _, (count, _) in batch],
+                "lasts": [last for _, (_, last) in batch],
+            })
+        if bucket_batch:
+            await db.execute(_ROLLUP_SQL, {
+                "codes": [code for (code, _), _ in bucket_batch],
+                "buckets": [bucket for (_, bucket), _ in bucket_batch],
+                "counts": [count for _, count in bucket_batch],
+            })
+        await db.commit()
+
+async def _flush_visitors():
+    global _pending_visitors
+    if not _pending_visitors:
+        return
+    visitors, _pending_visitors = _pending_visitors, {}
+    # HLL занимает не больше ~12 КБ на ссылку в день при любом трафике
+    pipe = async_redis_client.pipeline(transaction=False)
+    for key, fingerprints in visitors.items():
+        pipe.pfadd(key, *fingerprints)
+        pipe.expire(key, UNIQUE_VISITORS_RETENTION_DAYS * 86400)
+    try:
+        await pipe.execute()
+    except BaseException:
+        for key, fingerprints in visitors.items():
+            _pending_visitors.setdefault(key, set()).update(fingerprints)
+        raise
+
+async def flush_clicks() -> int:
+    flushed = await _flush_counts()
+    await _flush_visitors()
+    return flushed
+
+async def _flush_counts() -> int:
+    global _pending, _pending_buckets
+    if not _pending and not _pending_buckets:
+        return 0
+    pending, _pending = _pending, {}
+    buckets, _pending_buckets = _pending_buckets, {}
+    # Сортировка дает одинаковый порядок блокировок строк во всех воркерах
+    items = sorted(pending.items())
+    bucket_items = sorted(buckets.items())
+    done = done_buckets = 0
+    try:
+        while done < len(items) or done_buckets < len(bucket_items):
+            batch = items[done:done + CLICK_FLUSH_BATCH_SIZE]
+            bucket_batch = bucket_items[done_buckets:done_buckets + CLICK_FLUSH_BATCH_SIZE]
+            await _write_batch(batch, bucket_batch)
+            done += len(batch)
+            done_buckets += len(bucket_batch)
+    except BaseException:
+        # Незаписанные дельты возвращаем в буфер до следующей попытки
+        for code, (count, last) in items[done:]:
+            _merge(code, count, last)
+        for key, count in bucket_items[done_buckets:]:
+            _merge_bucket(key, count)
+        raise
+    return len(items)
+
+async def compact_click_rollups(retention_days: int = ROLLUP_HOURLY_RETENTION_DAYS):
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    async with AsyncSessionLocal() as db:
+        await db.execute(_COMPACT_SQL, {"cutoff": cutoff})
+        await db.commit()
+
+def get_click_series(db: Session, link_id: int, start: datetime, end: datetime, granularity: str) -> list:
+    bucket = func.date_trunc(granularity, LinkClickRollup.bucket_start, "UTC")
+    rows = (
+        db.query(bucket.label("bucket_start"), func.sum(LinkClickRollup.clicks).label("clicks"))
+        .filter(
+            LinkClickRollup.link_id == link_id,
+            LinkClickRollup.bucket_start >= start,
+            LinkClickRollup.bucket_start < end,
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+        .all()
+    )
+    return [{"bucket_start": row.bucket_start, "clicks": row.clicks} for row in rows]
+
+def count_unique_visitors(short_code: str, start: datetime, end: datetime) -> int:
+    # Дневная точность: PFCOUNT по нескольким ключам объединяет HLL на лету, без PFMERGE
+    first = max(start, end - timedelta(days=UNIQUE_VISITORS_RETENTION_DAYS)).date()
+    last = (end - timedelta(microseconds=1)).date()
+    keys = [_visitors_key(short_code, first + timedelta(days=offset)) for offset in range((last - first).days + 1)]
+    return redis_client.pfcount(*keys) if keys else 0
 
-_executor = ThreadPoolExecutor()
+async def _run_flusher():
+    global _last_compaction
+    while True:
+        try:
+            await asyncio.wait_for(_flush_event.wait(), timeout=CLICK_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _flush_event.clear()
+        try:
+            await flush_clicks()
+        except Exception:
+            CLICK_FLUSH_ERRORS.inc()
+            logger.exception("Не удалось сохранить статистику переходов")
+        if time.monotonic() - _last_compaction >= ROLLUP_COMPACT_INTERVAL:
+            _last_compaction = time.monotonic()
+            try:
+                await compact_click_rollups()
+            except Exception:
+                logger.exception("Не удалось свернуть часовую статистику в дневную")
 
-def _update_link_stats(short_code: str):
-    db: Session = next(get_db())
-    link = db.query(Link).filter(Link.short_code == short_code).first()
-    if link:
-        link.access_count += 1
-        link.last_accessed = datetime.utcnow()
-        db.commit()
-    db.close()
+def start_click_flusher():
+    global _flush_event, _flusher_task
+    _flush_event = asyncio.Event()
+    _flusher_task = asyncio.create_task(_run_flusher())
 
-async def update_link_stats(short_code: str):
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(_executor, _update_link_stats, short_code)
\ No newline at end of file
+async def stop_click_flusher():
+    global _flush_event, _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        try:
+            await _flusher_task
+        except asyncio.CancelledError:
+            pass
+    _flusher_task = None
+    _flush_event = None
+    # Сохраняем все, что накопилось к моменту остановки
+    await flush_clicks()
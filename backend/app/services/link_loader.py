@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from redis.exceptions import LockError
+from sqlalchemy import select
+
+from app.core.cache import CachedLink, async_redis_client, get_url_from_cache_async, set_url_to_cache_async
+from app.core.config import LINK_LOAD_LOCK_TTL, LINK_LOAD_WAIT, LINK_LOAD_POLL_INTERVAL
+from app.core.database import AsyncSessionLocal
+from app.models.link import Link
+
+logger = logging.getLogger(__name__)
+
+# Загрузки в процессе: short_code -> задача, результат которой ждут все запросы
+_inflight: Dict[str, asyncio.Task] = {}
+
+async def _load_from_db(short_code: str) -> Optional[CachedLink]:
+    # Только основная БД: отставшая реплика вернула бы старый URL или удаленную ссылку,
+    # и они жили бы в кэше до LINK_CACHE_TTL. У посетителей редиректа нет cookie read-your-writes
+    started = time.monotonic()
+    async with AsyncSessionLocal() as db:
+        link = (await db.execute(
+            select(Link.original_url, Link.expires_at, Link.redirect_code, Link.exact_clicks)
+            .where(Link.short_code == short_code)
+        )).first()
+    if not link:
+        return None
+    return await set_url_to_cache_async(
+        short_code,
+        link.original_url,
+        link.expires_at,
+        delta=time.monotonic() - started,
+        redirect_code=link.redirect_code,
+        exact_clicks=link.exact_clicks,
+    )
+
+async def _wait_for_other_loader(short_code: str, lock_name: str) -> Optional[CachedLink]:
+    deadline = time.monotonic() + LINK_LOAD_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LINK_LOAD_POLL_INTERVAL)
+        entry = await get_url_from_cache_async(short_code)
+        if entry is not None or not await async_redis_client.exists(lock_name):
+            return entry
+    return None
+
+async def _load(short_code: str, refresh: bool) -> Optional[CachedLink]:
+    # Аренда в Redis: из всех процессов в БД идет только держатель блокировки
+    lock_name = f"lock:link:{short_code}"
+    lock = async_redis_client.lock(lock_name, timeout=LINK_LOAD_LOCK_TTL, blocking=False)
+    if not await lock.acquire():
+        # Ключ загружает другой процесс; при досрочном обновлении текущее значение еще валидно
+        entry = await get_url_from_cache_async(short_code) if refresh else None
+        if entry is None:
+            entry = await _wait_for_other_loader(short_code, lock_name)
+        if entry is not None:
+            return entry
+        # Держатель не успел или ссылки нет - проверяем БД сами
+        return await _load_from_db(short_code)
+    try:
+        return await _load_from_db(short_code)
+    finally:
+        try:
+            await lock.release()
+        except LockError:
+            pass
+
+def _start(short_code: str, refresh: bool) -> asyncio.Task:
+    task = _inflight.get(short_code)
+    if task is None:
+        task = asyncio.create_task(_load(short_code, refresh))
+        _inflight[short_code] = task
+
+        def forget(done: asyncio.Task):
+            if _inflight.get(short_code) is done:
+                del _inflight[short_code]
+            if not done.cancelled() and done.exception() is not None and refresh:
+                # Ошибка фонового обновления не должна теряться молча
+                logger.warning("Не удалось досрочно обновить ссылку %s в кэше: %s", short_code, done.exception())
+
+        task.add_done_callback(forget)
+    return task
+
+async def load_link(short_code: str) -> Optional[CachedLink]:
+    # shield: отмена одного ожидающего запроса не отменяет общую загрузку
+    return await asyncio.shield(_start(short_code, refresh=False))
+
+def refresh_link_if_due(short_code: str, entry: CachedLink):
+    if entry.should_refresh() and short_code not in _inflight:
+        _start(short_code, refresh=True)
+
+async def stop_link_loads():
+    tasks = list(_inflight.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
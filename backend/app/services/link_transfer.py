@@ -0,0 +1,248 @@
+"""Массовый экспорт и импорт ссылок.
+
+Экспорт: python -m app.services.link_transfer export --user-id 1 -o links.csv
+Импорт:  python -m app.services.link_transfer import links.csv --user-id 2 --conflicts-out conflicts.csv
+
+Импорт проверяет строки, пишет их через COPY во временную таблицу и одним
+INSERT ... ON CONFLICT DO NOTHING переносит в link. Конфликты по short_code
+(с существующими ссылками и повторы внутри файла) не вставляются и попадают в отчет.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+import orjson
+from pydantic import AnyHttpUrl, ValidationError, parse_obj_as
+from pydantic.datetime_parse import parse_datetime
+from sqlalchemy import select
+
+from app.api.serializers import LINK_OUT_COLUMNS, iter_links_csv, iter_links_ndjson
+from app.core.config import LINK_IMPORT_SAMPLE_SIZE, LINKS_STREAM_BATCH_SIZE
+from app.core.database import SessionLocal, engine
+from app.models.link import Link
+from app.schemas.link import RedirectCode, check_redirect_policy
+from app.services.url_index import hash_url
+
+logger = logging.getLogger(__name__)
+
+_STAGING_COLUMNS = (
+    "line", "original_url", "url_hash", "short_code",
+    "created_at", "expires_at", "last_accessed", "access_count",
+    "redirect_code", "exact_clicks",
+)
+
+_CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE link_import (
+        line BIGINT,
+        original_url VARCHAR,
+        url_hash VARCHAR(64),
+        short_code VARCHAR(20),
+        created_at TIMESTAMPTZ,
+        expires_at TIMESTAMPTZ,
+        last_accessed TIMESTAMPTZ,
+        access_count INTEGER,
+        redirect_code SMALLINT,
+        exact_clicks BOOLEAN
+    ) ON COMMIT DROP
+"""
+
+_CONFLICTS_SQL = """
+    SELECT s.line, s.short_code FROM link_import s
+    WHERE EXISTS (SELECT 1 FROM link l WHERE l.short_code = s.short_code)
+       OR EXISTS (SELECT 1 FROM link_import d WHERE d.short_code = s.short_code AND d.line < s.line)
+    ORDER BY s.line
+"""
+
+# Из повторов внутри файла вставляется первая строка
+_MERGE_SQL = """
+    INSERT INTO link (
+        original_url, url_hash, short_code, created_at, expires_at, last_accessed, access_count,
+        redirect_code, exact_clicks, created_by_id
+    )
+    SELECT DISTINCT ON (short_code)
+        original_url, url_hash, short_code, COALESCE(created_at, now()), expires_at, last_accessed,
+        COALESCE(access_count, 0), redirect_code, exact_clicks, %(user_id)s
+    FROM link_import
+    ORDER BY short_code, line
+    ON CONFLICT (short_code) DO NOTHING
+"""
+
+
+class _CopySource:
+    """Файлоподобная обертка над генератором строк для cursor.copy_expert."""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        data = "".join(parts)
+        if size < 0:
+            size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def _read_records(source: io.TextIOBase, fmt: str) -> Iterator[tuple]:
+    if fmt == "ndjson":
+        for line_number, line in enumerate(source, 1):
+            if line.strip():
+                try:
+                    yield line_number, orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    yield line_number, None
+        return
+    reader = csv.DictReader(source)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _parse_datetime(value):
+    return parse_datetime(value).isoformat() if value not in (None, "") else None
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes", "t")
+
+
+def _stage_rows(records: Iterable[tuple], report: dict) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line_number, record in records:
+        report["rows"] += 1
+        try:
+            if not isinstance(record, dict) or not record.get("short_code"):
+                raise ValueError("short_code обязателен")
+            if len(str(record["short_code"])) > 20:
+                raise ValueError("short_code длиннее 20 символов")
+            # Та же проверка, что в LinkCreate: из БД URL потом отдаются без повторной валидации
+            original_url = str(parse_obj_as(AnyHttpUrl, record.get("original_url")))
+            access_count = record.get("access_count")
+            redirect_code = parse_obj_as(RedirectCode, int(record.get("redirect_code") or 302))
+            exact_clicks = _parse_bool(record.get("exact_clicks"))
+            check_redirect_policy(redirect_code, exact_clicks)
+            row = (
+                line_number,
+                original_url,
+                hash_url(original_url),
+                str(record["short_code"]),
+                _parse_datetime(record.get("created_at")),
+                _parse_datetime(record.get("expires_at")),
+                _parse_datetime(record.get("last_accessed")),
+                int(access_count) if access_count not in (None, "") else None,
+                redirect_code,
+                exact_clicks,
+            )
+        except (ValueError, TypeError, ValidationError):
+            report["invalid"] += 1
+            if len(report["invalid_lines"]) < LINK_IMPORT_SAMPLE_SIZE:
+                report["invalid_lines"].append(line_number)
+            continue
+        writer.writerow(row)
+        if buffer.tell() >= 1 << 16:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def import_links(source: io.TextIOBase, user_id: int, fmt: str = "csv", conflicts_out=None) -> dict:
+    report = {"rows": 0, "inserted": 0, "conflicts": 0, "invalid": 0, "conflict_sample": [], "invalid_lines": []}
+    started = time.monotonic()
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(_CREATE_STAGING_SQL)
+            cursor.copy_expert(
+                f"COPY link_import ({', '.join(_STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                _CopySource(_stage_rows(_read_records(source, fmt), report)),
+            )
+            staged = cursor.rowcount
+            cursor.execute("CREATE INDEX ON link_import (short_code, line)")
+            cursor.execute("ANALYZE link_import")
+            cursor.execute(_CONFLICTS_SQL + " LIMIT %(limit)s", {"limit": LINK_IMPORT_SAMPLE_SIZE})
+            report["conflict_sample"] = [short_code for _, short_code in cursor.fetchall()]
+            if conflicts_out is not None:
+                cursor.copy_expert(f"COPY ({_CONFLICTS_SQL}) TO STDOUT WITH (FORMAT csv, HEADER)", conflicts_out)
+            cursor.execute(_MERGE_SQL, {"user_id": user_id})
+            report["inserted"] = cursor.rowcount
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    report["conflicts"] = staged - report["inserted"]
+    logger.info(
+        "Импорт ссылок: %d строк, вставлено %d, конфликтов %d, ошибок %d за %.1f с",
+        report["rows"], report["inserted"], report["conflicts"], report["invalid"], time.monotonic() - started,
+    )
+    return report
+
+
+def export_links(user_id: int, out: io.TextIOBase, fmt: str = "csv") -> None:
+    db = SessionLocal()
+    try:
+        query = select(*LINK_OUT_COLUMNS).where(Link.created_by_id == user_id).order_by(Link.id)
+        rows = db.execute(query.execution_options(stream_results=True)).yield_per(LINKS_STREAM_BATCH_SIZE)
+        if fmt == "ndjson":
+            for chunk in iter_links_ndjson(rows):
+                out.write(chunk.decode())
+        else:
+            for chunk in iter_links_csv(rows):
+                out.write(chunk)
+    finally:
+        db.close()
+
+
+def main(argv=None) -> Optional[int]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Выгрузить ссылки пользователя")
+    export_parser.add_argument("--user-id", type=int, required=True)
+    export_parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    export_parser.add_argument("-o", "--output", help="Файл (по умолчанию stdout)")
+    import_parser = commands.add_parser("import", help="Загрузить ссылки из файла")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--user-id", type=int, required=True)
+    import_parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    import_parser.add_argument("--conflicts-out", help="CSV со всеми конфликтующими строками")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "export":
+        out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+        try:
+            export_links(args.user_id, out, args.format)
+        finally:
+            if args.output:
+                out.close()
+        return 0
+    conflicts_out = open(args.conflicts_out, "w", newline="", encoding="utf-8") if args.conflicts_out else None
+    try:
+        with open(args.path, newline="", encoding="utf-8") as source:
+            report = import_links(source, args.user_id, args.format, conflicts_out)
+    finally:
+        if conflicts_out is not None:
+            conflicts_out.close()
+    print(json.dumps(report, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
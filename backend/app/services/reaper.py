@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+
+from app.core.cache import async_redis_client, delete_url_caches_async, close_async_cache
+from app.core.config import (
+    INACTIVITY_DAYS,
+    EXPIRED_LINK_GRACE_DAYS,
+    REAPER_INTERVAL,
+    REAPER_BATCH_SIZE,
+    REAPER_BATCH_PAUSE,
+)
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.link import Link
+
+logger = logging.getLogger(__name__)
+
+_reaper_task: Optional[asyncio.Task] = None
+
+def delete_links_batch(condition, batch_size: int):
+    # Короткая транзакция на пачку; занятые другими строки пропускаем, а не ждем
+    ids = (
+        select(Link.id)
+        .where(condition)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    table = Link.__table__
+    return delete(table).where(table.c.id.in_(ids)).returning(table.c.short_code, table.c.url_hash)
+
+async def reap_links(
+    batch_size: int = REAPER_BATCH_SIZE,
+    inactivity_days: int = INACTIVITY_DAYS,
+    grace_days: int = EXPIRED_LINK_GRACE_DAYS,
+) -> int:
+    now = datetime.now(timezone.utc)
+    conditions = (
+        ("истекших", Link.expires_at < now - timedelta(days=grace_days)),
+        ("неактивных", func.coalesce(Link.last_accessed, Link.created_at) < now - timedelta(days=inactivity_days)),
+    )
+    total = 0
+    started = time.monotonic()
+    for name, condition in conditions:
+        deleted = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(delete_links_batch(condition, batch_size))).all()
+                await db.commit()
+            if not rows:
+                break
+            await delete_url_caches_async([row.short_code for row in rows], [row.url_hash for row in rows])
+            deleted += len(rows)
+            if len(rows) < batch_size:
+                break
+            await asyncio.sleep(REAPER_BATCH_PAUSE)
+        logger.info("Удалено %s ссылок: %d", name, deleted)
+        total += deleted
+    elapsed = time.monotonic() - started
+    logger.info("Очистка ссылок: %d строк за %.2f с (%.0f строк/с)", total, elapsed, total / elapsed if elapsed else 0)
+    return total
+
+async def _run_reaper(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Очистку запускают все воркеры, но за интервал проходит только один из них
+            if await async_redis_client.set("lock:reaper", 1, nx=True, ex=max(1, int(interval))):
+                await reap_links()
+        except Exception:
+            logger.exception("Фоновая очистка ссылок завершилась с ошибкой")
+
+def start_reaper(interval: float = REAPER_INTERVAL):
+    global _reaper_task
+    _reaper_task = asyncio.create_task(_run_reaper(interval))
+
+async def stop_reaper():
+    global _reaper_task
+    if _reaper_task is not None:
+        _reaper_task.cancel()
+        try:
+            await _reaper_task
+        except asyncio.CancelledError:
+            pass
+    _reaper_task = None
+
+async def _main(args):
+    try:
+        await reap_links(args.batch_size, args.inactivity_days, args.grace_days)
+    finally:
+        await close_async_cache()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Удаление истекших и неактивных ссылок")
+    parser.add_argument("--batch-size", type=int, default=REAPER_BATCH_SIZE)
+    parser.add_argument("--inactivity-days", type=int, default=INACTIVITY_DAYS)
+    parser.add_argument("--grace-days", type=int, default=EXPIRED_LINK_GRACE_DAYS)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,84 @@
+"""Разовая миграция существующей БД под текущие модели.
+
+    python -m app.services.schema_migration
+
+Запускается один раз перед выкатом новой версии, а не при каждом старте
+приложения: ALTER TABLE берет ACCESS EXCLUSIVE на link даже с IF NOT EXISTS,
+и очередь за этой блокировкой останавливает все редиректы. Поэтому DDL
+выполняется только для действительно отсутствующих колонок и с lock_timeout,
+а индексы строятся через CREATE INDEX CONCURRENTLY, не блокируя запись в link.
+"""
+import logging
+
+from sqlalchemy.schema import CreateIndex
+
+from app.core.config import MIGRATION_LOCK_TIMEOUT
+from app.core.database import engine, init_db
+from app.services.url_index import backfill_url_hashes
+
+logger = logging.getLogger(__name__)
+
+# Колонки link, появившиеся после создания таблицы; с константным DEFAULT это только изменение метаданных
+_LINK_COLUMNS = (
+    ("url_hash", "VARCHAR(64)"),
+    ("redirect_code", "SMALLINT NOT NULL DEFAULT 302"),
+    ("exact_clicks", "BOOLEAN NOT NULL DEFAULT false"),
+)
+
+
+def add_missing_columns() -> list:
+    with engine.begin() as conn:
+        existing = {
+            row.column_name
+            for row in conn.exec_driver_sql(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = 'link'"
+            )
+        }
+        missing = [(name, ddl) for name, ddl in _LINK_COLUMNS if name not in existing]
+        if missing:
+            # Не ждем долго в очереди за блокировкой: за ALTER встали бы все чтения link
+            conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'")
+            conn.exec_driver_sql("ALTER TABLE link " + ", ".join(f"ADD COLUMN {name} {ddl}" for name, ddl in missing))
+    added = [name for name, _ in missing]
+    logger.info("Добавлены колонки link: %s", ", ".join(added) or "нет")
+    return added
+
+
+def create_missing_indexes() -> list:
+    from app.models.link import Link
+
+    # CONCURRENTLY не работает внутри транзакции
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Прерванная сборка CONCURRENTLY оставляет невалидный индекс, который IF NOT EXISTS пропустил бы
+        invalid = conn.exec_driver_sql(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = 'link'::regclass AND NOT i.indisvalid"
+        ).scalars().all()
+        for name in invalid:
+            conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+        existing = set(conn.exec_driver_sql(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'link'"
+        ).scalars())
+        created = []
+        for index in sorted(Link.__table__.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                continue
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+            conn.exec_driver_sql(ddl.replace(" INDEX ", " INDEX CONCURRENTLY ", 1))
+            created.append(index.name)
+    logger.info("Построены индексы link: %s", ", ".join(created) or "нет")
+    return created
+
+
+def migrate():
+    # Новые таблицы создает create_all, существующие дополняются здесь
+    init_db()
+    add_missing_columns()
+    create_missing_indexes()
+    backfill_url_hashes()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate()
@@ -1,6 +1,42 @@
+import hashlib
 import random
 import string
 
+ALPHABET = string.digits + string.ascii_letters
+
 def generate_short_code(length: int = 6) -> str:
     characters = string.ascii_letters + string.digits
-    return ''.join(random.choices(characters, k=length))
\ No newline at end of file
+    return ''.join(random.choices(characters, k=length))
+
+def encode_base62(number: int, length: int = 1) -> str:
+    chars = []
+    while number:
+        number, rem = divmod(number, 62)
+        chars.append(ALPHABET[rem])
+    return ''.join(reversed(chars)).rjust(length, ALPHABET[0])
+
+def _feistel(value: int, half_bits: int, key: bytes, rounds: int = 4) -> int:
+    mask = (1 << half_bits) - 1
+    left, right = value >> half_bits, value & mask
+    for i in range(rounds):
+        digest = hashlib.blake2b(b"%d:%d" % (i, right), key=key, digest_size=8).digest()
+        left, right = right, left ^ (int.from_bytes(digest, "big") & mask)
+    return (left << half_bits) | right
+
+def scramble_id(number: int, space: int, key: bytes) -> int:
+    # Биекция на [0, space): сеть Фейстеля по степени двойки + cycle walking
+    half_bits = max(1, ((space - 1).bit_length() + 1) // 2)
+    value = number
+    while True:
+        value = _feistel(value, half_bits, key)
+        if value < space:
+            return value
+
+def code_from_id(number: int, min_length: int, key: bytes = None) -> str:
+    # Каждая длина - свой диапазон номеров, поэтому коды разных длин не пересекаются
+    length = min_length
+    while number >= 62 ** length:
+        length += 1
+    if key is not None:
+        number = scramble_id(number, 62 ** length, key)
+    return encode_base62(number, length)
@@ -0,0 +1,49 @@
+import hashlib
+import logging
+from urllib.parse import urlsplit, urlunsplit
+
+from app.core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    port = _DEFAULT_PORTS.get(scheme)
+    if port and netloc.endswith(":" + port):
+        netloc = netloc[:-len(port) - 1]
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+def hash_url(url: str) -> str:
+    # Фиксированная ширина ключа индекса независимо от длины URL
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+def backfill_url_hashes(batch_size: int = 10000) -> int:
+    # Для ссылок, созданных до появления link.url_hash; колонку и индекс добавляет app.services.schema_migration
+    from app.models.link import Link
+
+    db = SessionLocal()
+    total = 0
+    try:
+        while True:
+            rows = (
+                db.query(Link.id, Link.original_url)
+                .filter(Link.url_hash.is_(None))
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return total
+            db.bulk_update_mappings(Link, [{"id": row.id, "url_hash": hash_url(row.original_url)} for row in rows])
+            db.commit()
+            total += len(rows)
+            logger.info("url_hash заполнен для %d ссылок", total)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    backfill_url_hashes()
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_, select
+
+from app.core.cache import CachedLink, async_redis_client, set_urls_to_cache_async, close_async_cache
+from app.core.config import WARMUP_TOP_N, WARMUP_TIME_BUDGET, WARMUP_RECENT_DAYS, WARMUP_BATCH_SIZE
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.link import Link
+
+logger = logging.getLogger(__name__)
+
+async def warm_cache(
+    limit: int = WARMUP_TOP_N,
+    time_budget: float = WARMUP_TIME_BUDGET,
+    recent_days: int = WARMUP_RECENT_DAYS,
+) -> int:
+    started = time.monotonic()
+    now = datetime.now(timezone.utc)
+    query = (
+        select(Link.short_code, Link.original_url, Link.expires_at, Link.redirect_code, Link.exact_clicks)
+        .where(
+            func.coalesce(Link.last_accessed, Link.created_at) >= now - timedelta(days=recent_days),
+            or_(Link.expires_at.is_(None), Link.expires_at > now),
+        )
+        .order_by(Link.access_count.desc())
+        .limit(limit)
+    )
+    loaded = 0
+    async with AsyncSessionLocal() as db:
+        # Серверный курсор: в памяти не больше одной пачки
+        result = await db.stream(query)
+        async for rows in result.partitions(WARMUP_BATCH_SIZE):
+            await set_urls_to_cache_async(
+                (row.short_code, CachedLink(
+                    row.original_url, row.expires_at, redirect_code=row.redirect_code, exact_clicks=row.exact_clicks
+                )) for row in rows
+            )
+            loaded += len(rows)
+            if time.monotonic() - started >= time_budget:
+                logger.warning("Прогрев кэша остановлен по времени после %d ссылок", loaded)
+                break
+    logger.info("Прогрев кэша: %d ссылок за %.2f с", loaded, time.monotonic() - started)
+    return loaded
+
+async def warm_cache_within_budget(time_budget: float = WARMUP_TIME_BUDGET) -> int:
+    # Жесткая граница на случай медленной БД: готовность сервиса важнее прогрева
+    try:
+        # Кэш общий: при деплое прогревает один воркер, остальные сразу готовы к работе
+        if not await async_redis_client.set("lock:warmup", 1, nx=True, ex=max(60, int(time_budget))):
+            return 0
+        return await asyncio.wait_for(warm_cache(time_budget=time_budget), timeout=time_budget)
+    except asyncio.TimeoutError:
+        logger.warning("Прогрев кэша не уложился в %.1f с", time_budget)
+    except Exception:
+        logger.exception("Прогрев кэша завершился с ошибкой")
+    return 0
+
+async def _main(args):
+    try:
+        await warm_cache(args.top, args.time_budget, args.recent_days)
+    finally:
+        await close_async_cache()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Загрузка самых популярных ссылок в Redis")
+    parser.add_argument("--top", type=int, default=WARMUP_TOP_N)
+    parser.add_argument("--time-budget", type=float, default=WARMUP_TIME_BUDGET)
+    parser.add_argument("--recent-days", type=int, default=WARMUP_RECENT_DAYS)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,129 @@
+"""Память Redis на одну ссылку в кэше: ключ на ссылку (keys) против бакетов-хэшей (hash).
+
+    python -m benchmarks.cache_memory --db 15 --sizes 1000000 10000000
+
+Нужен отдельный Redis или отдельная база: выбранная --db очищается перед каждым
+замером. Записи строятся теми же функциями, что и в app/core/cache.py. Для 10M
+ссылок в раскладке keys Redis нужно около 1.5 ГБ памяти.
+
+Результат зависит от лимитов listpack сервера (hash-max-listpack-entries/value), они
+выводятся вместе с замерами. Скрипт их не меняет; --set-listpack-limits выставляет
+их через CONFIG SET, и это настройка всего экземпляра Redis, а не только --db.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from urllib.parse import urlsplit
+
+import redis
+
+BENCH_URL_TEMPLATE = "https://bench.example.com/articles/{}?utm_source=bench"
+
+
+def _bench_code(number: int) -> str:
+    from app.services.shortener import encode_base62
+
+    return "b" + encode_base62(number, 7)
+
+
+def _bucket_bits(links: int, fields_per_bucket: int) -> int:
+    return max(1, min(32, math.ceil(math.log2(max(links, 1) / fields_per_bucket))))
+
+
+def _fill(client, layout: str, links: int, bits: int, ttl: int, batch: int):
+    from app.core.cache import CachedLink, _encode_entry, _encode_hash_value, link_bucket_key
+
+    deadline = time.time() + ttl
+    pipe = client.pipeline(transaction=False)
+    for number in range(links):
+        short_code = _bench_code(number)
+        entry = CachedLink(BENCH_URL_TEMPLATE.format(number), refresh_at=deadline, delta=0.002)
+        if layout == "hash":
+            bucket = link_bucket_key(short_code, bits)
+            pipe.hset(bucket, short_code, _encode_hash_value(entry))
+            pipe.expire(bucket, ttl)
+        else:
+            pipe.setex(f"link:{short_code}", ttl, _encode_entry(entry))
+        if (number + 1) % batch == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def _listpack_share(client, sample: int = 1000) -> float:
+    keys = [client.randomkey() for _ in range(sample)]
+    keys = [key for key in keys if key]
+    if not keys:
+        return 0.0
+    encodings = [client.object("encoding", key) for key in keys]
+    return round(sum(encoding in ("listpack", "ziplist") for encoding in encodings) / len(encodings), 3)
+
+
+def _measure(client, layout: str, links: int, bits: int, args) -> dict:
+    client.flushdb()
+    before = client.info("memory")["used_memory"]
+    started = time.perf_counter()
+    _fill(client, layout, links, bits, args.ttl, args.batch)
+    elapsed = time.perf_counter() - started
+    used = client.info("memory")["used_memory"] - before
+    result = {
+        "layout": layout,
+        "links": links,
+        "keys": client.dbsize(),
+        "used_bytes": used,
+        "bytes_per_link": round(used / links, 1),
+        "fill_s": round(elapsed, 1),
+    }
+    if layout == "hash":
+        result["bucket_bits"] = bits
+        result["listpack_share"] = _listpack_share(client)
+    client.flushdb()
+    return result
+
+
+def main(argv=None) -> int:
+    from app.core.cache import _listpack_limit
+    from app.core.config import REDIS_URL
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    parser.add_argument("--db", type=int, required=True, help="База Redis, которая будет очищена")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--fields-per-bucket", type=int, default=64, help="Целевое число ссылок в бакете")
+    parser.add_argument("--bucket-bits", type=int, help="Вместо подбора по --fields-per-bucket")
+    parser.add_argument("--ttl", type=int, default=3600)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument(
+        "--set-listpack-limits",
+        type=int,
+        metavar="VALUE",
+        help="CONFIG SET hash-max-listpack-value=VALUE и entries под --fields-per-bucket для всего экземпляра",
+    )
+    args = parser.parse_args(argv)
+
+    url = urlsplit(args.redis_url)._replace(path=f"/{args.db}").geturl()
+    client = redis.Redis.from_url(url, decode_responses=True)
+    if args.set_listpack_limits:
+        client.config_set("hash-max-ziplist-entries", max(128, 2 * args.fields_per_bucket))
+        client.config_set("hash-max-ziplist-value", args.set_listpack_limits)
+    limits = {name: _listpack_limit(client.config_get("hash-max-*"), name) for name in ("entries", "value")}
+
+    results = []
+    for links in args.sizes:
+        bits = args.bucket_bits or _bucket_bits(links, args.fields_per_bucket)
+        keys_result = _measure(client, "keys", links, bits, args)
+        hash_result = _measure(client, "hash", links, bits, args)
+        hash_result["saving"] = round(1 - hash_result["used_bytes"] / keys_result["used_bytes"], 3)
+        results += [keys_result, hash_result]
+        print(json.dumps([keys_result, hash_result]), file=sys.stderr)
+    print(json.dumps({
+        "redis_version": client.info("server")["redis_version"],
+        "listpack_limits": limits,
+        "results": results,
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""Нагрузочный прогон редиректа, создания, списка и поиска ссылок.
+
+Примеры (из каталога backend, с запущенными Postgres и Redis):
+
+    python -m benchmarks.loadtest seed --users 20 --links-per-user 5000
+    python -m benchmarks.loadtest run --in-process --duration 30 --output current.json
+    python -m benchmarks.loadtest run --base-url http://localhost:8000 --baseline baseline.json
+    python -m benchmarks.loadtest compare baseline.json current.json --threshold 0.1
+
+--in-process запускает приложение в этом же процессе через ASGI-транспорт httpx
+(без uvicorn и сети), но с настоящими Postgres и Redis из DATABASE_URL/REDIS_URL.
+"""
+import argparse
+import asyncio
+import bisect
+import contextlib
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+BENCH_USER_PREFIX = "bench_user_"
+BENCH_PASSWORD = "benchpass"
+BENCH_URL_TEMPLATE = "https://bench.example.com/{}"
+SCENARIOS = ("redirect", "create", "list", "search")
+
+
+def _bench_code(number: int) -> str:
+    from app.services.shortener import encode_base62
+
+    # 8 символов: не пересекается с кодами аллокатора (6 символов) и alias'ами тестов
+    return "b" + encode_base62(number, 7)
+
+
+def seed(args):
+    from sqlalchemy import insert, delete, select
+
+    from app.core.database import engine, init_db
+    from app.core.security import hash_password
+    from app.models.user import User
+    from app.models.link import Link
+    from app.services.url_index import hash_url
+
+    init_db()
+    password_hash = hash_password(BENCH_PASSWORD)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(delete(User).where(User.username.like(BENCH_USER_PREFIX + "%")))
+        conn.execute(insert(User), [
+            {"username": f"{BENCH_USER_PREFIX}{i}", "password_hash": password_hash, "is_admin": False}
+            for i in range(args.users)
+        ])
+        user_ids = list(conn.execute(
+            select(User.id).where(User.username.like(BENCH_USER_PREFIX + "%")).order_by(User.id)
+        ).scalars())
+    counter = itertools.count()
+    rows = []
+    for user_id in user_ids:
+        for _ in range(args.links_per_user):
+            number = next(counter)
+            url = BENCH_URL_TEMPLATE.format(number)
+            rows.append({
+                "original_url": url,
+                "url_hash": hash_url(url),
+                "short_code": _bench_code(number),
+                "created_by_id": user_id,
+                "access_count": 0,
+            })
+            if len(rows) >= args.chunk_size:
+                with engine.begin() as conn:
+                    conn.execute(insert(Link), rows)
+                rows = []
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(insert(Link), rows)
+    total = next(counter)
+    print(json.dumps({
+        "users": len(user_ids),
+        "links": total,
+        "seconds": round(time.perf_counter() - started, 2),
+    }))
+
+
+class ZipfSampler:
+    """Выбор ключа с вероятностью ~ 1 / rank^s (горячие ссылки в начале списка)."""
+
+    def __init__(self, keys, s: float, seed: int):
+        self.keys = keys
+        self.random = random.Random(seed)
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, len(keys) + 1)))
+
+    def sample(self):
+        point = self.random.random() * self.cum_weights[-1]
+        return self.keys[bisect.bisect_left(self.cum_weights, point)]
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summarize(latencies, errors: int, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def _login(client: httpx.AsyncClient, username: str) -> dict:
+    response = await client.post("/api/auth/login", json={"username": username, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return {"session_id": response.cookies["session_id"]}
+
+
+async def _run_scenario(name, make_request, clients, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        client = clients[worker_id % len(clients)]
+        while time.perf_counter() < deadline:
+            method, url, kwargs, expected = make_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != expected:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return _summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def _run(args) -> dict:
+    from sqlalchemy import select
+
+    from app.core.database import SessionLocal
+    from app.models.user import User
+    from app.models.link import Link
+
+    db = SessionLocal()
+    try:
+        codes = list(db.execute(
+            select(Link.short_code)
+            .join(User, User.id == Link.created_by_id)
+            .where(User.username.like(BENCH_USER_PREFIX + "%"))
+            .order_by(Link.id)
+            .limit(args.hot_keys)
+        ).scalars())
+        usernames = list(db.execute(
+            select(User.username).where(User.username.like(BENCH_USER_PREFIX + "%")).order_by(User.id)
+        ).scalars())
+    finally:
+        db.close()
+    if not codes or not usernames:
+        sys.exit("Нет данных для прогона: сначала выполните seed")
+
+    rng = random.Random(args.seed)
+    # Одинаковый набор ключей при повторных прогонах, но без корреляции ранга и id
+    rng.shuffle(codes)
+    sampler = ZipfSampler(codes, args.zipf_s, args.seed)
+    create_counter = itertools.count()
+
+    def make_redirect():
+        return "GET", f"/{sampler.sample()}", {"follow_redirects": False}, 302
+
+    def make_create():
+        return "POST", "/api/links/", {"json": {"original_url": f"https://bench-create.example.com/{next(create_counter)}"}}, 201
+
+    def make_list():
+        return "GET", "/api/links/", {"params": {"limit": args.page_size}}, 200
+
+    def make_search():
+        number = rng.randrange(len(codes))
+        return "GET", "/api/links/search", {"params": {"original_url": BENCH_URL_TEMPLATE.format(number)}}, 200
+
+    makers = {"redirect": make_redirect, "create": make_create, "list": make_list, "search": make_search}
+
+    if args.in_process:
+        from app.main import app
+
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+        lifespan = app.router.lifespan_context(app)
+    else:
+        transport = None
+        base_url = args.base_url
+        lifespan = None
+
+    results = {}
+    if lifespan is not None:
+        await lifespan.__aenter__()
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            def new_client(cookies=None):
+                return httpx.AsyncClient(base_url=base_url, transport=transport, timeout=30, cookies=cookies)
+
+            login_client = await stack.enter_async_context(new_client())
+            clients = [
+                await stack.enter_async_context(new_client(await _login(login_client, username)))
+                for username in usernames[:args.sessions]
+            ]
+            for name in args.scenarios:
+                if args.warmup:
+                    await _run_scenario(name, makers[name], clients, args.concurrency, args.warmup)
+                results[name] = await _run_scenario(name, makers[name], clients, args.concurrency, args.duration)
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "target": "in-process" if args.in_process else args.base_url,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "zipf_s": args.zipf_s,
+            "hot_keys": len(codes),
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        now = current.get("scenarios", {}).get(name)
+        if now is None:
+            continue
+        if base["throughput_rps"] and now["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {now['throughput_rps']} rps")
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[metric] and now[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {base[metric]} -> {now[metric]}")
+        if now["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {now['errors']}")
+    return regressions
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _report_regressions(regressions) -> int:
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Заполнить БД тестовыми пользователями и ссылками")
+    seed_parser.add_argument("--users", type=int, default=10)
+    seed_parser.add_argument("--links-per-user", type=int, default=1000)
+    seed_parser.add_argument("--chunk-size", type=int, default=5000)
+
+    run_parser = commands.add_parser("run", help="Прогнать сценарии и вывести JSON с результатами")
+    target = run_parser.add_mutually_exclusive_group()
+    target.add_argument("--base-url", default="http://localhost:8000")
+    target.add_argument("--in-process", action="store_true")
+    run_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    run_parser.add_argument("--duration", type=float, default=10.0, help="Секунд на сценарий")
+    run_parser.add_argument("--warmup", type=float, default=2.0, help="Секунд прогрева перед замером")
+    run_parser.add_argument("--concurrency", type=int, default=32)
+    run_parser.add_argument("--sessions", type=int, default=4, help="Сколько пользователей залогинить")
+    run_parser.add_argument("--hot-keys", type=int, default=10000, help="Размер множества ключей для редиректа")
+    run_parser.add_argument("--zipf-s", type=float, default=1.1)
+    run_parser.add_argument("--page-size", type=int, default=100)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", help="Файл для JSON (по умолчанию stdout)")
+    run_parser.add_argument("--baseline", help="Сравнить с сохраненным результатом")
+    run_parser.add_argument("--threshold", type=float, default=0.1, help="Допустимое ухудшение, доля")
+
+    compare_parser = commands.add_parser("compare", help="Сравнить два JSON-результата")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "seed":
+        seed(args)
+        return 0
+    if args.command == "compare":
+        return _report_regressions(compare(_load(args.baseline), _load(args.current), args.threshold))
+
+    result = asyncio.run(_run(args))
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        return _report_regressions(compare(_load(args.baseline), result, args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Сравнение сериализации списка ссылок: response_model (orm_mode) против быстрого пути.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 20
+
+БД и Redis не нужны: строки генерируются в памяти. Перед замером проверяется,
+что оба пути дают одинаковый JSON.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+
+def _make_rows(count: int) -> list:
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for number in range(count):
+        created_at = started + timedelta(seconds=number, microseconds=number % 1000)
+        rows.append((
+            f"https://bench.example.com/articles/{number}?utm_source=bench",
+            number + 1,
+            f"b{number:07d}",
+            created_at,
+            created_at + timedelta(days=30) if number % 3 == 0 else None,
+            created_at + timedelta(hours=1) if number % 2 == 0 else None,
+            number % 977,
+            301 if number % 5 == 0 else 302,
+            number % 7 == 0,
+        ))
+    return rows
+
+
+def _make_orm_links(rows: list) -> list:
+    from app.models.link import Link
+    from app.models.user import User  # noqa: F401 - нужен для настройки связи Link.created_by
+    from app.api.serializers import LINK_OUT_FIELDS
+
+    return [Link(**dict(zip(LINK_OUT_FIELDS, row))) for row in rows]
+
+
+def _orm_mode_body(field, links) -> bytes:
+    # Тот же путь, что FastAPI проходит для response_model=List[LinkOut]
+    content = asyncio.run(serialize_response(field=field, response_content=links, is_coroutine=True))
+    return JSONResponse(content).body
+
+
+def _fast_body(rows) -> bytes:
+    from app.api.serializers import links_to_dicts
+
+    return ORJSONResponse(links_to_dicts(rows)).body
+
+
+def _measure(name: str, func, rows: int, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "path": name,
+        "rows": rows,
+        "best_ms": round(best * 1000, 2),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 2),
+        "rows_per_s": round(rows / best),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    from app.schemas.link import LinkOut
+
+    rows = _make_rows(args.rows)
+    links = _make_orm_links(rows)
+    field = create_response_field(name="Response_list_links", type_=List[LinkOut])
+
+    if json.loads(_orm_mode_body(field, links)) != json.loads(_fast_body(rows)):
+        print("Ответы различаются", file=sys.stderr)
+        return 1
+    results = [
+        _measure("orm_mode", lambda: _orm_mode_body(field, links), args.rows, args.repeat),
+        _measure("fast", lambda: _fast_body(rows), args.rows, args.repeat),
+    ]
+    speedup = results[0]["best_ms"] / results[1]["best_ms"] if results[1]["best_ms"] else 0.0
+    print(json.dumps({"results": results, "speedup": round(speedup, 1)}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,15 @@ if "session" not in st.session_state:
     st.session_state.session = fu.get_requests_session()
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
+if "data_version" not in st.session_state:
+    st.session_state.data_version = 0
+
+def cache_key():
+    return (fu.session_key(st.session_state.session), st.session_state.data_version)
+
+def invalidate_cache():
+    # Следующее чтение после изменения данных пойдет в API, а не в кэш
+    st.session_state.data_version += 1
 
 API_URL = st.secrets["API_URL"] if "API_URL" in st.secrets else "http://urlshort_backend:8000"
 
@@ -20,7 +29,7 @@ if menu == "Вход/Регистрация":
     if choice == "Регистрация":
         email = st.text_input("Email (опционально)")
         if st.button("Зарегистрироваться"):
-            result = fu.register(API_URL, username, password, email)
+            result = fu.register(API_URL, username, password, st.session_state.session, email)
             if result.get("detail"):
                 st.error(result["detail"])
             else:
@@ -40,7 +49,7 @@ elif menu == "Мои ссылки":
     else:
         st.header("Ваши ссылки")
         links_container = st.empty()
-        links = fu.get_links(API_URL, st.session_state.session)
+        links = fu.get_links_cached(API_URL, cache_key(), st.session_state.session)
         if links:
             import pandas as pd
             df = pd.DataFrame(links)
@@ -62,8 +71,9 @@ elif menu == "Мои ссылки":
                             st.error(result["detail"])
                         else:
                             st.success(f"Ссылка {link['short_code']} удалена")
-                            # Обновляем таблицу, получая заново список ссылок:
-                            updated_links = fu.get_links(API_URL, st.session_state.session)
+                            invalidate_cache()
+                            # Обновляем таблицу без повторной загрузки всего списка
+                            updated_links = [item for item in links if item["short_code"] != link["short_code"]]
                             if updated_links:
                                 df_updated = pd.DataFrame(updated_links)
                                 df_updated["Short URL"] = public_api_url + "/" + df_updated["short_code"].astype(str)
@@ -81,16 +91,25 @@ elif menu == "Создать ссылку":
         original_url = st.text_input("Оригинальный URL")
         custom_alias = st.text_input("Кастомный alias (необязательно)")
         expires_in_days = st.number_input("Срок жизни ссылки (в днях, 0 - бессрочно)", min_value=0, value=0)
+        redirect_code = st.selectbox(
+            "Тип редиректа",
+            [302, 307, 301, 308],
+            format_func=lambda code: f"{code} ({'постоянный' if code in (301, 308) else 'временный'})",
+        )
+        exact_clicks = st.checkbox("Точный подсчет переходов (без кэширования в браузере)")
         if st.button("Создать"):
             payload = {
                 "original_url": original_url,
                 "custom_alias": custom_alias if custom_alias != "" else None,
                 "expires_in_days": expires_in_days if expires_in_days > 0 else None,
+                "redirect_code": redirect_code,
+                "exact_clicks": exact_clicks,
             }
             result = fu.create_link(API_URL, payload, st.session_state.session)
             if result.get("detail"):
                 st.error(result["detail"])
             else:
+                invalidate_cache()
                 st.success(f"Ссылка создана: {result['short_code']}")
 
 elif menu == "Аналитика":
@@ -98,15 +117,20 @@ elif menu == "Аналитика":
         st.warning("Войдите, чтобы просмотреть аналитику")
     else:
         st.header("Аналитика по ссылкам")
-        links = fu.get_links(API_URL, st.session_state.session)
-        if links:
+        top = st.number_input("Сколько самых популярных ссылок показать", min_value=1, max_value=100, value=10)
+        summary = fu.get_summary_cached(API_URL, cache_key(), st.session_state.session, int(top))
+        if summary.get("detail"):
+            st.error(summary["detail"])
+        elif summary.get("total_links"):
+            cols = st.columns(4)
+            cols[0].metric("Всего ссылок", summary["total_links"])
+            cols[1].metric("Всего переходов", summary["total_clicks"])
+            cols[2].metric("Активных", summary["active_links"])
+            cols[3].metric("Истекших", summary["expired_links"])
             import pandas as pd
-            df = pd.DataFrame(links)
-            if "short_code" in df.columns and "access_count" in df.columns:
-                df = df.rename(columns={"short_code": "Ссылка", "access_count": "Количество переходов"})
-                st.bar_chart(df.set_index("Ссылка")["Количество переходов"])
-            else:
-                st.info("Нет данных для аналитики (нет столбцов short_code или access_count).")
+            df = pd.DataFrame(summary["top"])
+            df = df.rename(columns={"short_code": "Ссылка", "access_count": "Количество переходов"})
+            st.bar_chart(df.set_index("Ссылка")["Количество переходов"])
         else:
             st.info("Нет данных для отображения аналитики.")
 
@@ -121,6 +145,9 @@ elif menu == "Удалить аккаунт":
             if resp.get("message") == "Пользователь удалён":
                 st.success("Аккаунт удалён. Пожалуйста, перезайдите.")
                 st.session_state.logged_in = False
+            elif resp.get("job_id"):
+                st.success("Аккаунт удаляется в фоне. Пожалуйста, перезайдите позже.")
+                st.session_state.logged_in = False
             else:
                 st.error(resp.get("detail") or "Неизвестная ошибка при удалении аккаунта")
 
@@ -1,8 +1,22 @@
 import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+CACHE_TTL = 30
+POOL_SIZE = 10
 
 
 def get_requests_session() -> requests.Session:
-    return requests.Session()
+    # Одна сессия на пользователя: keep-alive и пул соединений к API
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def session_key(session: requests.Session) -> str:
+    return session.cookies.get("session_id") or ""
 
 
 def delete_link(api_url: str, short_code: str, session: requests.Session) -> dict:
@@ -15,10 +29,10 @@ def delete_link(api_url: str, short_code: str, session: requests.Session) -> dic
         return {"detail": "Ошибка удаления ссылки"}
 
 
-def register(api_url: str, username: str, password: str, email: str = None) -> dict:
+def register(api_url: str, username: str, password: str, session: requests.Session, email: str = None) -> dict:
     url = f"{api_url}/api/auth/register"
     payload = {"username": username, "password": password, "email": email}
-    response = requests.post(url, json=payload)
+    response = session.post(url, json=payload)
     try:
         return response.json()
     except Exception:
@@ -40,13 +54,45 @@ def logout(api_url: str, session: requests.Session) -> None:
     session.post(url)
 
 
-def get_links(api_url: str, session: requests.Session) -> list:
-    url = f"{api_url}/api/links"
-    response = session.get(url)
+def get_links(api_url: str, session: requests.Session, page_size: int = 500) -> list:
+    url = f"{api_url}/api/links/"
+    params = {"limit": page_size}
+    links = []
+    # Постранично по курсору из заголовка X-Next-Cursor
+    while True:
+        response = session.get(url, params=params)
+        try:
+            page = response.json()
+        except Exception:
+            return links
+        if not isinstance(page, list):
+            return links
+        links.extend(page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return links
+        params["cursor"] = cursor
+
+
+def get_summary(api_url: str, session: requests.Session, top: int = 10) -> dict:
+    url = f"{api_url}/api/links/summary"
+    response = session.get(url, params={"top": top})
     try:
         return response.json()
     except Exception:
-        return []
+        return {"detail": "Ошибка получения аналитики"}
+
+
+# Кэш Streamlit общий для всех пользователей процесса, поэтому ключ включает
+# session_id и версию данных пользователя; сама сессия (_session) не хэшируется.
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_links_cached(api_url: str, cache_key: tuple, _session: requests.Session) -> list:
+    return get_links(api_url, _session)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_summary_cached(api_url: str, cache_key: tuple, _session: requests.Session, top: int = 10) -> dict:
+    return get_summary(api_url, _session, top)
 
 
 def create_link(api_url: str, payload: dict, session: requests.Session) -> dict: